@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+RESPONSE_CACHE_PATH = os.environ.get("LORAFL_RESPONSE_CACHE", os.path.expanduser("~/.cache/lorafl/responses.sqlite"))
+MAX_ENTRIES = 200000
+
+_lock = threading.Lock()
+_writes = 0
+
+
+def open_response_cache(path=RESPONSE_CACHE_PATH):
+    """
+    Open (and create if needed) the response cache: one row per generated completion,
+    keyed by response_key(...).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS responses (
+               key       TEXT PRIMARY KEY,
+               response  TEXT NOT NULL,
+               created   REAL,
+               last_used REAL
+           )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+    conn.commit()
+    return conn
+
+
+def response_key(model, prompt, decoding, seed, sample, salt=None):
+    """
+    SHA-256 of everything that determines a sampled completion: the model identity
+    (base weights, adapter and backend), the prompt, the decoding parameters, the seed,
+    the caller's salt (e.g. bug and stage) and which of the num_return_sequences
+    samples it is.
+    """
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "decoding": decoding, "seed": seed, "salt": salt, "sample": sample},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def sample_seed(prompt, decoding, seed, sample, salt=None):
+    """
+    Torch seed for one sample, derived from the same fields as response_key minus the
+    model, so a sample does not depend on which other prompts or samples were generated
+    in the same call.
+    """
+    payload = json.dumps(
+        {"prompt": prompt, "decoding": decoding, "seed": seed, "salt": salt, "sample": sample},
+        sort_keys=True,
+    )
+    return int(hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def get_response(conn, key):
+    """
+    Return the stored completion for key, or None.
+    """
+    with _lock:
+        row = conn.execute("SELECT response FROM responses WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET last_used=? WHERE key=?", (time.time(), key))
+        conn.commit()
+    return row[0]
+
+
+def put_response(conn, key, response, max_entries=MAX_ENTRIES):
+    """
+    Store a completion. Every 500 writes, the least recently used rows beyond
+    max_entries are dropped.
+    """
+    global _writes
+    now = time.time()
+    with _lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+            (key, response, now, now),
+        )
+        _writes += 1
+        if _writes % 500 == 0:
+            evict(conn, max_entries)
+        conn.commit()
+
+
+def evict(conn, max_entries=MAX_ENTRIES):
+    """
+    Keep only the max_entries most recently used rows. Callers hold _lock.
+    """
+    conn.execute(
+        """DELETE FROM responses WHERE key IN (
+               SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+           )""",
+        (max_entries,),
+    )
@@ -2,14 +2,20 @@ from helper.get_answer import get_answer
 from helper.reconstruct_class import reconstruct_class
 from helper.collect_covered_classes import collect_covered_classes
 from helper.reconstruct_class_with_method import reconstruct_class_with_method
+from mutation.class_summary_table import load_class_summaries
+from helper.response_cache import RESPONSE_CACHE_PATH, open_response_cache, response_key, sample_seed, get_response, put_response
 from helper.helpers import format_test_info, format_test_info_exclude_related, extract_class_from_response, get_review, process_response,check_if_exist_class, check_if_exist_method, count_test_occurrences, process_response_simple
 
 project_basic_dir = get_base_dir()
 p,b,_,_,_ = get_bug_info()
 
 import os
+import copy
 import json
+import hashlib
+import shutil
 import torch
+from collections import OrderedDict
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
 # Optionally import PeftModel only if parameter_dir is provided
@@ -18,49 +24,352 @@ try:
 except ImportError:
     PeftModel = None
 
+BACKENDS = ("auto", "cpu_int8", "bnb_int8", "bnb_int4")
+
+MERGED_CACHE_DIR = os.environ.get("LORAFL_MERGED_CACHE", os.path.expanduser("~/.cache/lorafl/merged"))
+
+def merge_cache_key(model_dir, parameter_dir=None):
+    """
+    Content address of a model: SHA-256 over every adapter file's bytes and the base
+    model's config.json bytes. The base weight shards are identified by name and size
+    only, since hashing many GB on every start would defeat the cache. Names the merged
+    checkpoint cache and identifies the model in the response cache. A model_dir that
+    is not a local directory (a hub id) is identified by its name.
+    """
+    h = hashlib.sha256()
+    if parameter_dir:
+        for name in sorted(os.listdir(parameter_dir)):
+            file_path = os.path.join(parameter_dir, name)
+            if os.path.isfile(file_path):
+                h.update(f"adapter:{name}\0".encode())
+                with open(file_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+    if not os.path.isdir(model_dir):
+        h.update(f"hub:{model_dir}\0".encode())
+        return h.hexdigest()
+    with open(os.path.join(model_dir, "config.json"), "rb") as f:
+        h.update(b"config\0" + f.read())
+    for name in sorted(os.listdir(model_dir)):
+        if name.endswith((".safetensors", ".bin")):
+            h.update(f"base:{name}:{os.path.getsize(os.path.join(model_dir, name))}\0".encode())
+    return h.hexdigest()
+
+def merged_model_dir(model_dir, parameter_dir):
+    """
+    Directory of the base model with the LoRA adapter merged in, saved as safetensors
+    under MERGED_CACHE_DIR/<merge_cache_key>. It is built on first use; later runs load
+    it directly, with no adapter to apply and no extra matmuls per token.
+    """
+    path = os.path.join(MERGED_CACHE_DIR, merge_cache_key(model_dir, parameter_dir))
+    if os.path.exists(os.path.join(path, ".complete")):
+        return path
+
+    print(f"Merging {parameter_dir} into {model_dir} -> {path}")
+    base = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=torch.float16, low_cpu_mem_usage=True)
+    merged = PeftModel.from_pretrained(base, parameter_dir).merge_and_unload()
+
+    # Write next to the final path and rename, so an interrupted merge is never picked up
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    merged.save_pretrained(tmp_path, safe_serialization=True)
+    open(os.path.join(tmp_path, ".complete"), "w").close()
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process finished the same merge first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    del base, merged
+    return path
+
 class LlamaModelWrapper:
-    def __init__(self, model_dir, parameter_dir=None, max_context_length=8192):
+    def __init__(self, model_dir, parameter_dir=None, max_context_length=8192, backend="auto", merge_lora=False,
+                 response_cache_path=None):
+        """
+        backend selects how the model is loaded; generation works the same for all of them:
+          - "auto":     float16 weights placed by device_map="auto" (GPU)
+          - "cpu_int8": float32 load on CPU, LoRA merged into the base weights, then every
+                        nn.Linear dynamically quantized to int8 (torch.ao); for GPU-less nodes
+          - "bnb_int8", "bnb_int4": bitsandbytes 8-bit / 4-bit NF4 weights, LoRA kept as an adapter
+        With merge_lora, the adapter in parameter_dir is merged into the base weights once
+        (see merged_model_dir) and the merged checkpoint is loaded instead of base + adapter.
+        With response_cache_path, seeded generations are stored in and served from that
+        sqlite response cache (see generate_batch).
+        """
         self.max_context_length = max_context_length
+        self.backend = backend
         
         # Load tokenizer once
         self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
         self.tokenizer.pad_token = self.tokenizer.eos_token
         
+        self.response_cache = None
+        if response_cache_path:
+            self.response_cache = open_response_cache(response_cache_path)
+            self.model_id = {"weights": merge_cache_key(model_dir, parameter_dir), "backend": backend}
+
         # Load model once
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_dir,
-            torch_dtype=torch.float16,
-            device_map="auto"
-        )
-        if parameter_dir and PeftModel is not None:
-            self.model = PeftModel.from_pretrained(self.model, parameter_dir)
+        if merge_lora and parameter_dir and PeftModel is not None:
+            model_dir, parameter_dir = merged_model_dir(model_dir, parameter_dir), None
+        self.model = self._load_model(model_dir, parameter_dir, backend)
         
         self.model.eval()
 
-    def generate_response(self, prompt, max_new_tokens=64, temperature=0.7, top_p=0.9):
-        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
-        if input_ids.shape[1] > self.max_context_length:
-            return -1, f"Input too long: {input_ids.shape[1]} tokens (max {self.max_context_length})"
-        
+        # prefix text -> (prefix token ids, KV cache of those tokens), least recently used first
+        self.prefix_cache = OrderedDict()
+        self.max_cached_prefixes = 4
+
+    @staticmethod
+    def _load_model(model_dir, parameter_dir, backend):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+        if backend == "cpu_int8":
+            model = AutoModelForCausalLM.from_pretrained(
+                model_dir,
+                torch_dtype=torch.float32,
+                low_cpu_mem_usage=True
+            )
+            if parameter_dir and PeftModel is not None:
+                # Quantized Linear layers cannot host a LoRA adapter, so fold it in first
+                model = PeftModel.from_pretrained(model, parameter_dir).merge_and_unload()
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        if backend == "auto":
+            model = AutoModelForCausalLM.from_pretrained(
+                model_dir,
+                torch_dtype=torch.float16,
+                device_map="auto"
+            )
+        else:
+            from transformers import BitsAndBytesConfig
+            if backend == "bnb_int8":
+                quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+            else:
+                quantization_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=torch.float16
+                )
+            model = AutoModelForCausalLM.from_pretrained(
+                model_dir,
+                quantization_config=quantization_config,
+                device_map="auto"
+            )
+        if parameter_dir and PeftModel is not None:
+            model = PeftModel.from_pretrained(model, parameter_dir)
+        return model
+
+    def cache_prefix(self, prefix):
+        """
+        Run the model over `prefix` once and keep its KV cache, so prompts starting with
+        it only prefill the remaining tokens. The last prefix token is left out of the
+        cache because it can merge with the text that follows into a different token.
+
+        Raises:
+            ValueError: if prefix has fewer than two tokens, leaving nothing to cache.
+        """
+        if prefix in self.prefix_cache:
+            self.prefix_cache.move_to_end(prefix)
+            return self.prefix_cache[prefix]
+
+        prefix_ids = self.tokenizer(prefix, return_tensors="pt").input_ids.to(self.model.device)[:, :-1]
+        if prefix_ids.shape[1] == 0:
+            raise ValueError(f"Prefix {prefix!r} is too short to cache")
+        with torch.no_grad():
+            past_key_values = self.model(input_ids=prefix_ids, use_cache=True).past_key_values
+
+        self.prefix_cache[prefix] = (prefix_ids, past_key_values)
+        if len(self.prefix_cache) > self.max_cached_prefixes:
+            self.prefix_cache.popitem(last=False)
+        return prefix_ids, past_key_values
+
+    def _find_prefix(self, prompt, input_ids):
+        # Longest cached prefix whose tokens are exactly the first tokens of the prompt
+        best = None
+        for text, (prefix_ids, past_key_values) in self.prefix_cache.items():
+            n = prefix_ids.shape[1]
+            if (0 < n < input_ids.shape[1] and prompt.startswith(text)
+                    and torch.equal(input_ids[0, :n], prefix_ids[0])
+                    and (best is None or n > best[0].shape[1])):
+                best = (prefix_ids, past_key_values)
+        return best
+
+    def _generate_from_prefix(self, input_ids, cached, max_new_tokens, temperature, top_p, num_return_sequences):
+        _, past_key_values = cached
+        # generate() extends the cache in place, so every call works on its own copy
+        past_key_values = copy.deepcopy(past_key_values)
+        if num_return_sequences > 1:
+            input_ids = input_ids.repeat(num_return_sequences, 1)
+            if hasattr(past_key_values, "batch_repeat_interleave"):
+                past_key_values.batch_repeat_interleave(num_return_sequences)
+            else:
+                past_key_values = tuple(
+                    tuple(t.repeat_interleave(num_return_sequences, dim=0) for t in layer)
+                    for layer in past_key_values
+                )
+
         with torch.no_grad():
             output_ids = self.model.generate(
                 input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
                 max_new_tokens=max_new_tokens,
                 do_sample=True,
                 temperature=temperature,
                 top_p=top_p,
                 pad_token_id=self.tokenizer.eos_token_id
             )
-        response_text = self.tokenizer.decode(
-            output_ids[0][input_ids.shape[1]:], 
+        texts = self.tokenizer.batch_decode(
+            output_ids[:, input_ids.shape[1]:],
             skip_special_tokens=True
         )
-        return 1, response_text.strip()
+        return [(1, text.strip()) for text in texts]
+
+    def _generate_seeded(self, prompt, max_new_tokens, temperature, top_p, num_return_sequences, seed, salt):
+        # Every sample is drawn on its own, under its own seed, from a prefill of the prompt
+        # itself, so its text depends only on (prompt, decoding, seed, salt, sample index)
+        # and not on the batch, the cache hits or the prefixes of the call it came from
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids
+        length = input_ids.shape[1]
+        if length > self.max_context_length:
+            return [(-1, f"Input too long: {length} tokens (max {self.max_context_length})")] * num_return_sequences
+        input_ids = input_ids.to(self.model.device)
+        cached = self.cache_prefix(prompt) if length > 1 else None
+
+        decoding = {"max_new_tokens": max_new_tokens, "temperature": temperature, "top_p": top_p}
+        samples = []
+        for j in range(num_return_sequences):
+            torch.manual_seed(sample_seed(prompt, decoding, seed, j, salt))
+            if cached is not None:
+                samples += self._generate_from_prefix(input_ids, cached, max_new_tokens, temperature, top_p, 1)
+                continue
+            with torch.no_grad():
+                output_ids = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    do_sample=True,
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=self.tokenizer.eos_token_id
+                )
+            text = self.tokenizer.decode(output_ids[0, length:], skip_special_tokens=True)
+            samples.append((1, text.strip()))
+        return samples
+
+    def generate_response(self, prompt, max_new_tokens=64, temperature=0.7, top_p=0.9, seed=None, salt=None, use_cache=True):
+        return self.generate_batch([prompt], max_new_tokens, temperature, top_p, seed=seed, salt=salt, use_cache=use_cache)[0][0]
+
+    def generate_batch(self, prompts, max_new_tokens=64, temperature=0.7, top_p=0.9,
+                       num_return_sequences=1, batch_size=8, prefix=None, seed=None, salt=None, use_cache=True):
+        """
+        Sample responses for many prompts with batched generate() calls.
+
+        Prompts are sorted by token length and grouped into batches of batch_size, so
+        each batch is left-padded only up to its own longest prompt. Repeated samples of
+        the same prompt come from num_return_sequences instead of separate calls.
+
+        With `prefix` (e.g. the instructions and project summary shared by a bug's
+        prompts), the prefix is prefilled once and cached (see cache_prefix). Any prompt
+        starting with a cached prefix is generated on its own from a copy of that KV
+        cache, with its samples decoding from the same state, instead of joining a
+        padded batch.
+
+        With a seed, batching is given up for reproducibility: each prompt is prefilled
+        once (and kept in the prefix cache), and sample j is generated alone with torch
+        seeded from sample_seed(prompt, decoding parameters, seed, j, salt). `salt` keeps
+        calls that sample the same prompt with the same seed apart (mem_main passes the
+        bug and stage). When the wrapper has a response cache each sample is stored
+        under response_key(model, prompt, decoding parameters, seed, j, salt), and a
+        prompt whose samples are all stored is served from the cache without touching
+        the model. Without a seed, sampling is not reproducible and nothing is cached.
+        use_cache=False bypasses the cache (no reads or writes).
+
+        Returns:
+            list: one entry per prompt, in input order, each a list of num_return_sequences
+                  (rv, text) pairs as returned by generate_response; prompts longer than
+                  max_context_length get (-1, error message) pairs.
+        """
+        results = [None] * len(prompts)
+
+        keys = None
+        if seed is not None and use_cache and self.response_cache is not None:
+            decoding = {"max_new_tokens": max_new_tokens, "temperature": temperature, "top_p": top_p}
+            keys = [[response_key(self.model_id, prompt, decoding, seed, j, salt) for j in range(num_return_sequences)]
+                    for prompt in prompts]
+            for idx in range(len(prompts)):
+                stored = [get_response(self.response_cache, key) for key in keys[idx]]
+                if all(text is not None for text in stored):
+                    results[idx] = [(1, text) for text in stored]
+            if all(result is not None for result in results):
+                return results
+        todo = [idx for idx, result in enumerate(results) if result is None]
+
+        if seed is not None:
+            for idx in todo:
+                results[idx] = self._generate_seeded(prompts[idx], max_new_tokens, temperature, top_p,
+                                                     num_return_sequences, seed, salt)
+        elif prefix is not None:
+            self.cache_prefix(prefix)
+
+        lengths = []
+        for idx in todo:
+            if results[idx] is not None:
+                # Already generated sample by sample under a seed
+                continue
+            prompt = prompts[idx]
+            input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids
+            length = input_ids.shape[1]
+            if length > self.max_context_length:
+                results[idx] = [(-1, f"Input too long: {length} tokens (max {self.max_context_length})")] * num_return_sequences
+                continue
+
+            cached = self._find_prefix(prompt, input_ids.to(self.model.device)) if self.prefix_cache else None
+            if cached is not None:
+                results[idx] = self._generate_from_prefix(input_ids.to(self.model.device), cached, max_new_tokens,
+                                                          temperature, top_p, num_return_sequences)
+            else:
+                lengths.append((length, idx))
+
+        # Longest first, so the first batch fails fast if it does not fit in memory
+        lengths.sort(reverse=True)
+        self.tokenizer.padding_side = "left"
+        for start in range(0, len(lengths), batch_size):
+            batch = [idx for _, idx in lengths[start:start + batch_size]]
+            inputs = self.tokenizer([prompts[idx] for idx in batch], return_tensors="pt", padding=True).to(self.model.device)
+
+            with torch.no_grad():
+                output_ids = self.model.generate(
+                    input_ids=inputs.input_ids,
+                    attention_mask=inputs.attention_mask,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=True,
+                    temperature=temperature,
+                    top_p=top_p,
+                    num_return_sequences=num_return_sequences,
+                    pad_token_id=self.tokenizer.eos_token_id
+                )
+            texts = self.tokenizer.batch_decode(
+                output_ids[:, inputs.input_ids.shape[1]:],
+                skip_special_tokens=True
+            )
+            # generate() returns the num_return_sequences samples of each prompt consecutively
+            for k, idx in enumerate(batch):
+                samples = texts[k * num_return_sequences:(k + 1) * num_return_sequences]
+                results[idx] = [(1, text.strip()) for text in samples]
+
+        if keys is not None:
+            for idx in todo:
+                for key, (rv, text) in zip(keys[idx], results[idx]):
+                    if rv == 1:
+                        put_response(self.response_cache, key, text)
+
+        return results
 
 
 
 # Example of a function that processes multiple prompts
-def mem_main(repeat):
+def mem_main(repeat, seed=None):
 
     verbose = True
     
@@ -70,8 +379,11 @@ def mem_main(repeat):
         return -1
     count = 0
 
-    # Load the LLaMA model only once
-    llama_model = LlamaModelWrapper(model_dir, parameter_dir)
+    # Load the LLaMA model only once; LORAFL_BACKEND=cpu_int8 on GPU-less nodes
+    # With a seed, responses are cached on disk across runs; LORAFL_NO_RESPONSE_CACHE=1 turns that off
+    llama_model = LlamaModelWrapper(model_dir, parameter_dir, backend=os.environ.get("LORAFL_BACKEND", "auto"),
+                                    merge_lora=os.environ.get("LORAFL_MERGE_LORA") == "1",
+                                    response_cache_path=None if os.environ.get("LORAFL_NO_RESPONSE_CACHE") == "1" else RESPONSE_CACHE_PATH)
 
     for i in range(len(p)):
         if p[i] != "Closure":
@@ -97,8 +409,7 @@ def mem_main(repeat):
         
         
         # Read and store file contents
-        file_names = []
-        summaries = []
+        class_summaries = {}
         try:
             
             with open(covered_class_file_path, 'r') as f:
@@ -107,12 +418,7 @@ def mem_main(repeat):
             with open(summary_file_path, 'r') as f:
                 summary_content = f.read()
             
-            with open(class_file_path, 'r') as csvfile:
-                reader = csv.reader(csvfile)
-                next(reader)
-                for row in reader:
-                    file_names.append(row[0].strip())
-                    summaries.append(row[1].strip())
+            class_summaries = load_class_summaries(class_file_path)
 
             with open(test_info_path, 'r') as f:
                 test_info_content = json.load(f)  # Load JSON data as a Python dictionary      
@@ -136,8 +442,7 @@ def mem_main(repeat):
 
         covered_classes_for_prompt = ""####
         for i, covered_class in enumerate(covered_classes,start=1):
-            if covered_class in file_names:
-                index = file_names.index(covered_class)
+            if covered_class in class_summaries:
                 class_name = covered_class.split(".")[-2]
                 if class_name in class_name_set:
                     duplicates.add(class_name)  # Store duplicates
@@ -145,7 +450,7 @@ def mem_main(repeat):
                     class_name_set.add(class_name)
 
                 if stage_2_simple:
-                    summary = summaries[index]
+                    summary = class_summaries[covered_class]
                 else:
                     if project_name == "Chart":
                         summary_file_name = "org.jfree." +covered_class.rsplit(".java", 1)[0] +"_summary.txt"
@@ -195,8 +500,9 @@ def mem_main(repeat):
         
             prompt1 = generate_prompt1(summary_content, covered_classes_for_prompt)
             step_1_results = []
-            for _ in range(repeat):
-                rv, response = llama_model.generate_response(prompt1)
+            # Every sample decodes from the same prefilled prompt
+            for rv, response in llama_model.generate_batch([prompt1], num_return_sequences=repeat, prefix=prompt1, seed=seed,
+                                                            salt=f"{project_name}_{bug_id}:step1")[0]:
                 if rv == 1:
                     step_1_results.append(response)
                 else:
@@ -219,9 +525,9 @@ def mem_main(repeat):
         if (class_length>3):
             prompt2 = generate_prompt1(summary_content, detailed_review)
 
-
-            for _ in range(repeat):
-                rv, response = llama_model.generate_response(prompt1)
+            # The same prompt as the first step, so its cached prefill is reused
+            for rv, response in llama_model.generate_batch([prompt1], num_return_sequences=repeat, prefix=prompt1, seed=seed,
+                                                            salt=f"{project_name}_{bug_id}:step2")[0]:
                 if rv == 1:
                     results.append(response)
                 else:
@@ -4,84 +4,42 @@ from parse_failing_test import parse_failing_tests
 from collections import Counter
 from run_command import run_command
 import shutil
+import json
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from construct_path import construct_path
+from file_index import files_for_class
+from source_files import test_dir, load_manifest, resolve_class_file, load_json
+from workspace import project_paths, restore_workspace, provision_workspaces, provision_baseline
+
+JACOCO_LIB = "/home/yinseok/lorafl/tools/jacoco/lib"
+JAVA_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "java")
+# Tests per instrumented JVM; each JVM has to finish within run_command's timeout
+SESSION_CHUNK = 100
 
 def reset(p):
-    if p=="Chart":
-        project_path = "/home/yinseok/lorafl/temp/Chart_1/Chart_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Chart_1/Chart_1_fixed"
-    elif p=="Lang":
-        project_path = "/home/yinseok/lorafl/temp/Lang_1/Lang_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Lang_1/Lang_1_fixed"
-    elif p=="Time":
-        project_path = "/home/yinseok/lorafl/temp/Time_4/Time_4_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Time_4/Time_4_fixed"
-    elif p=="Closure":
-        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Closure_1/Closure_1_fixed"
-
-    for item in os.listdir(project_path):
-        item_path = os.path.join(project_path, item)
-        if os.path.isfile(item_path) or os.path.islink(item_path):
-            os.unlink(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
- 
-    # Copy everything from original_path to project_path
-    for item in os.listdir(original_path):
-        s = os.path.join(original_path, item)
-        d = os.path.join(project_path, item)
-        if os.path.isdir(s):
-            shutil.copytree(s, d)
-        else:
-             shutil.copy2(s, d)
-
-
-def find_files_with_substring(directory, substring):
-    """
-    Return a list of file names in the given directory
-    that contain the given substring.
-    """
-    result = []
-    
-    # List all files in the given directory
-    for filename in os.listdir(directory):
-        full_path = os.path.join(directory, filename)
-        
-        # Check if it's a file and contains the substring
-        if os.path.isfile(full_path) and substring in filename:
-            result.append(filename)
-    
-    return result
+    project_path, original_path = project_paths(p)
+    restore_workspace(project_path, original_path)
 
 
-def apply_coverage(p,t):
+def select_coverage_tests(p,t):
+    """
+    Pick the tests to collect coverage for, from the failing_tests results of class t.
 
+    Returns all failing tests if there are at most 20, otherwise the 20 most frequent
+    plus up to 30 random others. Returns None if there are no results for t.
+    """
     test_case_counter = Counter()
 
-
-    base_path = "/home/yinseok/lorafl/"
-
-    if p== "Chart":
-        project_path = "/home/yinseok/lorafl/temp/Chart_1/Chart_1_fixed"
-    elif p=="Lang":
-        project_path = "/home/yinseok/lorafl/temp/Lang_1/Lang_1_fixed"
-    elif p=="Time":
-        project_path = "/home/yinseok/lorafl/temp/Time_4/Time_4_fixed"
-    elif p == "Closure":
-        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
-
-    
     data_path = f"/home/yinseok/lorafl/mutation_data/{p}"
 
     results_path = data_path + "/results"
 
-    coverage_path = data_path + "/coverage"
-
-    files = find_files_with_substring(results_path, t)
+    files = files_for_class(results_path, t)
     
     if len(files)==0:
-        return
+        return None
     
     
     for file in files:
@@ -113,26 +71,317 @@ def apply_coverage(p,t):
         # Merge them
         final_test_cases = top_20 + random_30
 
-    print("Selected Test Cases:")
+    return final_test_cases
+
+
+def collect_coverage(p, t, tc, project_path, original_path, destination=None, raise_errors=False):
+    """
+    Run `defects4j coverage` for a single test in project_path and move the resulting
+    coverage.xml straight to destination, by default
+    mutation_data/<p>/coverage/coverage__<t>__<tc>.xml.
+
+    project_path is first restored to original_path. When original_path is the
+    compiled baseline, the restore only drops the previous run's Cobertura data and
+    instrumented classes, and the build has nothing to recompile.
+
+    Returns:
+      float: seconds spent, or None if no coverage.xml was produced. With raise_errors,
+             a run that raised (e.g. timed out) re-raises instead of returning None, so
+             callers can tell it apart from a completed run without coverage.
+    """
+    coverage_path = f"/home/yinseok/lorafl/mutation_data/{p}/coverage"
+
+    start = time.time()
+    restore_workspace(project_path, original_path)
+    coverage_command = f"defects4j coverage -w {project_path} -t {tc} -i total/{p}/total.src"
+    print(tc)
+
+    try:
+        print(run_command(coverage_command))
+    except Exception as e:
+        print(e)
+        if raise_errors:
+            raise
+        return None
+    
+    target_file = project_path + "/coverage.xml"
+    if destination is None:
+        destination = coverage_path + f"/coverage__{t}__{tc}.xml"
     
-    for tc in final_test_cases:
-        reset(p)
-        coverage_command = f"defects4j coverage -w {project_path} -t {tc} -i total/{p}/total.src"
-        print(tc)
+    if os.path.isfile(target_file):
+        shutil.move(target_file, destination)
+    else:
+        print("nothing~")
+        return None
+    return time.time() - start
+
+
+def collect_coverage_session(p, t, tests, project_path, original_path, out_dir=None, prefix=None,
+                             chunk_size=SESSION_CHUNK):
+    """
+    Collect coverage for all of tests in one instrumented JVM per chunk_size tests instead
+    of one `defects4j coverage` run (JVM start and instrumentation) per test.
+
+    The project is compiled with `defects4j compile`, then java/PerTestCoverage runs the
+    tests one after another under the JaCoCo agent, resetting it before each test and
+    dumping its execution data afterwards, so every test gets its own session.
+    java/CoberturaReport then writes every session in the layout of defects4j's
+    Cobertura reports to <out_dir>/<prefix><test>.xml, by default
+    mutation_data/<p>/coverage/coverage__<t>__<test>.xml, so the parsers downstream
+    read it unchanged. A chunk whose JVM dies or times out only loses the tests it had
+    not finished.
+
+    Two differences to per-test runs: JaCoCo only records whether a line ran, so hits
+    is 0 or 1, and a static initializer counts for the first test that loads its class.
+
+    Returns:
+      list of str: the tests whose coverage file was written.
+    """
+    if out_dir is None:
+        out_dir = f"/home/yinseok/lorafl/mutation_data/{p}/coverage"
+    if prefix is None:
+        prefix = f"coverage__{t}__"
+    agent = f"{JACOCO_LIB}/jacocoagent.jar"
+    cli = f"{JACOCO_LIB}/jacococli.jar"
+    work_dir = os.path.join(project_path, ".coverage_session")
+
+    restore_workspace(project_path, original_path)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    # Reports left over from an earlier run must not be mistaken for this session's output
+    for tc in tests:
+        if os.path.isfile(os.path.join(out_dir, prefix + tc + ".xml")):
+            os.unlink(os.path.join(out_dir, prefix + tc + ".xml"))
+
+    collected = []
+    try:
+        print(run_command(f"defects4j compile -w {project_path}"))
+        classes_dir = os.path.join(project_path, run_command(f"defects4j export -p dir.bin.classes -w {project_path}").strip())
+        test_cp = run_command(f"defects4j export -p cp.test -w {project_path}").strip()
+
+        sources = " ".join(os.path.join(JAVA_SRC, name) for name in ("PerTestCoverage.java", "CoberturaReport.java"))
+        print(run_command(f"javac -cp {agent}:{cli}:{test_cp} -d {work_dir} {sources}"))
+    except Exception as e:
+        print(e)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return collected
+
+    for start in range(0, len(tests), chunk_size):
+        chunk = tests[start:start + chunk_size]
+        exec_dir = os.path.join(work_dir, f"exec_{start}")
+        os.makedirs(exec_dir)
+        # The test list goes through a file; thousands of names do not fit on one command line
+        list_path = os.path.join(work_dir, f"tests_{start}.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(chunk) + "\n")
 
         try:
-            print(run_command(coverage_command))
+            print(run_command(f"java -javaagent:{agent}=output=none -cp {work_dir}:{test_cp} PerTestCoverage {exec_dir} {list_path}",
+                              project_path))
         except Exception as e:
             print(e)
+        try:
+            print(run_command(f"java -cp {work_dir}:{cli} CoberturaReport {classes_dir} total/{p}/total.src {exec_dir} {out_dir} {prefix}"))
+        except Exception as e:
+            print(e)
+
+        collected.extend(tc for tc in chunk
+                         if os.path.isfile(os.path.join(exec_dir, tc + ".exec"))
+                         and os.path.isfile(os.path.join(out_dir, prefix + tc + ".xml")))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return collected
+
+
+def apply_coverage(p,t,incremental=False,session=False):
+    """
+    Collect coverage for the selected tests of class t, one test after another.
+
+    With incremental=True all tests run against the compiled baseline (see
+    provision_baseline): the sources are compiled once, and between tests the working
+    copy keeps its classes while the previous run's coverage data is discarded.
+
+    With session=True all tests run in a single instrumented JVM (see
+    collect_coverage_session); only tests it could not cover fall back to one
+    `defects4j coverage` run each.
+    """
+    final_test_cases = select_coverage_tests(p,t)
+    if final_test_cases is None:
+        return
+
+    project_path, original_path = project_paths(p)
+    if incremental:
+        original_path = provision_baseline(p)
+
+    print("Selected Test Cases:")
+    
+    start = time.time()
+    timings = []
+    remaining = final_test_cases
+    if session:
+        collected = set(collect_coverage_session(p, t, final_test_cases, project_path, original_path))
+        print(f"{t}: {len(collected)}/{len(final_test_cases)} tests covered in one session")
+        remaining = [tc for tc in final_test_cases if tc not in collected]
+        timings = [0.0] * len(collected)
+    for tc in remaining:
+        timings.append(collect_coverage(p, t, tc, project_path, original_path))
+    elapsed = time.time() - start
+
+    collected = sum(1 for seconds in timings if seconds is not None)
+    print(f"{t}: coverage for {collected}/{len(final_test_cases)} tests in {elapsed:.1f}s")
+
+
+def apply_coverage_parallel(p,t,k,incremental=False,session=False):
+    """
+    Same as apply_coverage, but collects the selected tests' coverage on k isolated
+    working copies at once.
+
+    Every worker runs in its own checkout, so each coverage.xml is written to a
+    private path and moved directly to its destination file. Per-test timings are
+    printed at the end. With session=True a single JVM already runs every test, so
+    this is apply_coverage(p, t, incremental, session=True).
+    """
+    if session:
+        return apply_coverage(p, t, incremental, session)
+
+    final_test_cases = select_coverage_tests(p,t)
+    if final_test_cases is None:
+        return
+
+    _, original_path = project_paths(p)
+    if incremental:
+        original_path = provision_baseline(p)
+    workspaces = queue.Queue()
+    for path in provision_workspaces(p, min(k, len(final_test_cases)) or 1, original_path):
+        workspaces.put(path)
+
+    def task(tc):
+        project_path = workspaces.get()
+        try:
+            return collect_coverage(p, t, tc, project_path, original_path)
+        finally:
+            workspaces.put(project_path)
+
+    print("Selected Test Cases:")
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=k) as executor:
+        timings = list(executor.map(task, final_test_cases))
+    elapsed = time.time() - start
+
+    for tc, seconds in zip(final_test_cases, timings):
+        print(f"  {tc}: {'failed' if seconds is None else f'{seconds:.1f}s'}")
+    collected = sum(1 for seconds in timings if seconds is not None)
+    print(f"{t}: coverage for {collected}/{len(final_test_cases)} tests with {k} workers in {elapsed:.1f}s")
+
+
+def suite_coverage_path(p):
+    return f"/home/yinseok/lorafl/mutation_data/{p}/suite_coverage"
+
+
+def is_test_method(method):
+    # JUnit 3 tests are the test* methods, JUnit 4 ones carry @Test
+    return method["name"].startswith("test") or "@Test" in method.get("snippet", "")
+
+
+def list_suite_tests(p, project_path):
+    """
+    All test methods of p's suite as "<TestClass>::<testMethod>".
+
+    The test classes come from `defects4j export -p tests.all`, their methods from the
+    parsed test sources in output_test. A class without a parsed source, or without test
+    methods of its own (e.g. one that only inherits them), cannot be expanded.
+
+    Returns:
+      (list of str, list of str): the tests, and the test classes that could not be expanded.
+    """
+    output = run_command(f"defects4j export -p tests.all -w {project_path}")
+    classes = [line.strip() for line in output.splitlines() if line.strip() and " " not in line.strip()]
+
+    files, _ = load_manifest(test_dir(p))
+    tests = []
+    unresolved = []
+    for cls in classes:
+        path = resolve_class_file(test_dir(p), cls)
+        if path is None or files[os.path.basename(path)][1] != cls:
+            unresolved.append(cls)
             continue
-        
-        target_file = project_path + "/coverage.xml"
-        destination = coverage_path + f"/coverage__{t}__{tc}.xml"
-        
-        if os.path.isfile(target_file):
-            shutil.copy2(target_file, destination)
-        else:
-            print("nothing~")
-        
+        methods = sorted({m["name"] for m in load_json(path).get("methods", []) if is_test_method(m)})
+        if not methods:
+            unresolved.append(cls)
+            continue
+        tests.extend(f"{cls}::{method}" for method in methods)
+    return tests, unresolved
+
+
+def collect_suite_coverage(p, k=1, incremental=False):
+    """
+    Collect the coverage of every test in p's suite into
+    mutation_data/<p>/suite_coverage/<test>.xml, for build_line_test_index.
+
+    The suite is written to suite_coverage/tests.json (see list_suite_tests). Tests run
+    through collect_coverage_session, SESSION_CHUNK tests per instrumented JVM; a test
+    the session could not cover gets its own `defects4j coverage` run. Only a run that
+    completed without producing coverage.xml leaves an empty <test>.none file; a run that
+    timed out or raised leaves nothing, so the next collection tries the test again.
+    Tests that already have a result are skipped, so an interrupted collection continues
+    where it stopped. With k > 1 the tests are split over k isolated working copies.
+    """
+    suite_path = suite_coverage_path(p)
+    os.makedirs(suite_path, exist_ok=True)
+
+    project_path, original_path = project_paths(p)
+    restore_workspace(project_path, original_path)
+    tests, unresolved = list_suite_tests(p, project_path)
+    if unresolved:
+        print(f"{p}: {len(unresolved)} test classes could not be expanded into test methods")
+    tmp_path = suite_path + "/tests.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"tests": tests, "unresolved": unresolved}, f)
+    os.replace(tmp_path, suite_path + "/tests.json")
+
+    todo = [tc for tc in tests
+            if not os.path.exists(f"{suite_path}/{tc}.xml") and not os.path.exists(f"{suite_path}/{tc}.none")]
+    print(f"{p}: {len(tests) - len(todo)}/{len(tests)} suite tests already collected")
+    if not todo:
+        return
+
+    if incremental:
+        original_path = provision_baseline(p)
+    k = max(1, min(k, len(todo)))
+    workspaces = queue.Queue()
+    if k > 1:
+        for path in provision_workspaces(p, k, original_path):
+            workspaces.put(path)
+    else:
+        workspaces.put(project_path)
+
+    def task(shard):
+        path = workspaces.get()
+        try:
+            collected = set(collect_coverage_session(p, None, shard, path, original_path, suite_path, ""))
+            for tc in shard:
+                if tc in collected:
+                    continue
+                try:
+                    seconds = collect_coverage(p, None, tc, path, original_path, f"{suite_path}/{tc}.xml",
+                                               raise_errors=True)
+                except Exception as e:
+                    print(f"{tc}: {e}")
+                    continue
+                if seconds is None:
+                    open(f"{suite_path}/{tc}.none", "w").close()
+                else:
+                    collected.add(tc)
+            return len(collected)
+        finally:
+            workspaces.put(path)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=k) as executor:
+        collected = sum(executor.map(task, [todo[i::k] for i in range(k)]))
+    elapsed = time.time() - start
+
+    print(f"{p}: suite coverage for {collected}/{len(todo)} tests with {k} workers in {elapsed:.1f}s")
+
 
 #apply_coverage("Closure", "com.google.javascript.jscomp.ScopedAliases")
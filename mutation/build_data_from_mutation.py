@@ -3,8 +3,18 @@ import random
 from run_command import run_command
 import os
 import shutil
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from construct_path import construct_path
+from extract_method_coverage import build_line_test_index
+from job_ledger import is_done, run_job
+from workspace import project_paths, restore_workspace, provision_workspaces, provision_baseline, mark_stale
+
+
+# Above this many tests reaching a line, one full-suite run beats a `defects4j test -t` per test
+MAX_SELECTED_TESTS = 20
 
 
 def parse_log_data(log_data):
@@ -30,34 +40,8 @@ def parse_log_data(log_data):
         return None
 
 def reset(p):
-    if p=="Chart":
-        project_path = "/home/yinseok/lorafl/temp/Chart_1/Chart_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Chart_1/Chart_1_fixed"
-    elif p=="Lang":
-        project_path = "/home/yinseok/lorafl/temp/Lang_1/Lang_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Lang_1/Lang_1_fixed"
-    elif p=="Time":
-        project_path = "/home/yinseok/lorafl/temp/Time_4/Time_4_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Time_4/Time_4_fixed"
-    elif p=="Closure":
-        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Closure_1/Closure_1_fixed"
-
-    for item in os.listdir(project_path):
-        item_path = os.path.join(project_path, item)
-        if os.path.isfile(item_path) or os.path.islink(item_path):
-            os.unlink(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
-
-    # Copy everything from original_path to project_path
-    for item in os.listdir(original_path):
-        s = os.path.join(original_path, item)
-        d = os.path.join(project_path, item)
-        if os.path.isdir(s):
-            shutil.copytree(s, d)
-        else:
-            shutil.copy2(s, d)
+    project_path, original_path = project_paths(p)
+    restore_workspace(project_path, original_path)
 
 
 def apply_mutation(target_file_path: str, parsed: dict) -> None:
@@ -103,18 +87,18 @@ def apply_mutation(target_file_path: str, parsed: dict) -> None:
         file.writelines(lines)
 
 
-def build_data_from_mutation(p,t,n):
-    base_path = "/home/yinseok/lorafl/"
+def select_mutants(p,t,n,rng=random):
+    """
+    Load kill.<t>.csv and mutants.<t>.log for class t and pick up to n FAIL mutants.
 
-    if p== "Chart":
-        project_path = "/home/yinseok/lorafl/temp/Chart_1/Chart_1_fixed"
-    elif p=="Lang":
-        project_path = "/home/yinseok/lorafl/temp/Lang_1/Lang_1_fixed"
-    elif p=="Time":
-        project_path = "/home/yinseok/lorafl/temp/Time_4/Time_4_fixed"
-    elif p == "Closure":
-        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
-    
+    rng is the random source for the sample; pass a seeded random.Random to get
+    the same selection again (e.g. when resuming from the ledger).
+
+    Returns:
+      (parsed_mutants, target_file_path) where parsed_mutants is a list of
+      parse_log_data dicts ordered by mutant ID, or None if inputs are missing.
+    """
+    base_path = "/home/yinseok/lorafl/"
     data_path = f"/home/yinseok/lorafl/mutation_data/{p}"
 
     kill_file_path = data_path + f"/kill/kill.{t}.csv"
@@ -127,17 +111,15 @@ def build_data_from_mutation(p,t,n):
             kill_data = list(reader)
     else:
         print(f"{kill_file_path} not found.")
-        return 0
+        return None
 
     if os.path.exists(log_file_path):
         with open(log_file_path, encoding='utf-8') as f:
             log_data = [line.strip() for line in f]
     else:
         print(f"{log_file_path} not found.")
-        return 0
-    
-    test_command = f"defects4j test -w {project_path}"
-    
+        return None
+
     #if p=="Closure":
     if p=="Time":
         bug_id = 4
@@ -148,48 +130,227 @@ def build_data_from_mutation(p,t,n):
     target_file_path = construct_path(base_path,p,bug_id) + "/"+t.replace('.','/') + ".java"
     if not os.path.exists(target_file_path):
         print("target_file not existing")
-        return 0
-
-    fail_count = 0
+        return None
 
     fail_entries = [(i, row) for i, row in enumerate(kill_data) if row[1] == 'FAIL']
     
     if len(fail_entries) > n:
         print(f"Length : {len(fail_entries)}, just using {n}")
-        fail_entries = random.sample(fail_entries, n)
-
-    fail_count = len(fail_entries)
+        fail_entries = rng.sample(fail_entries, n)
 
     selected_fail_indices = set(int(i) for _, [i,_] in fail_entries)
-    
-    well_done_count = 0
+
+    parsed_mutants = []
     for i in range(len(log_data)+1):
         if i in selected_fail_indices:
-            reset(p)
-            parsed = parse_log_data(log_data[i-1])
-            try:
-                apply_mutation(target_file_path, parsed)
-            except Exception as e:
-                print(e)
-                continue
-            print(parsed)
-            try:
-                output = run_command(test_command)
-            except Exception as e:
-                print(e)
-                continue
+            parsed_mutants.append(parse_log_data(log_data[i-1]))
+    return parsed_mutants, target_file_path
+
+
+def run_mutant(p, t, parsed, project_path, original_path, target_file_path, incremental=False, tests=None):
+    """
+    Apply one mutant inside project_path, run the test suite there and copy the
+    resulting failing_tests into mutation_data/<p>/results/.
+
+    target_file_path may point into any working copy; it is re-rooted onto project_path.
+    The working copy is reset to original_path before and after the run.
+    With incremental=True, original_path is expected to be a compiled baseline
+    (see provision_baseline) and only what the mutant affects is marked for recompilation.
+    If tests is a non-empty list of "<TestClass>::<testMethod>", only those tests are run
+    (one `defects4j test -t` each) and their failing_tests are concatenated; an empty
+    list means no test reaches the mutant, which then counts as having no failing test
+    without running anything. tests=None runs the full suite.
+
+    Returns:
+      bool: True if a failing_tests file was collected, False if no test failed.
+    Raises:
+      Exception: if the mutant could not be applied or a test run failed (e.g. timed
+                 out), so the caller can record the mutant as failed and retry it.
+    """
+    default_project_path, _ = project_paths(p)
+    target_file_path = os.path.join(project_path, os.path.relpath(target_file_path, default_project_path))
+    data_path = f"/home/yinseok/lorafl/mutation_data/{p}"
+    test_command = f"defects4j test -w {project_path}"
+
+    if tests is not None and not tests:
+        print("No test reaches the mutated line, no failing test!")
+        return False
+
+    restore_workspace(project_path, original_path)
+    apply_mutation(target_file_path, parsed)
+    print(parsed)
+    if incremental:
+        mark_stale(project_path, target_file_path, parsed)
+    target_file = project_path + "/failing_tests"
+    destination = data_path + f"/results/failing_tests__{t}__{parsed['ID']}"
+
+    done = False
+    try:
+        if tests:
+            failing = []
+            for tc in tests:
+                if os.path.isfile(target_file):
+                    os.unlink(target_file)
+                output = run_command(f"{test_command} -t {tc}")
+                print(output)
+                if os.path.isfile(target_file):
+                    with open(target_file, encoding='utf-8') as f:
+                        content = f.read()
+                    if content.strip():
+                        failing.append(content)
+            if failing:
+                with open(destination, "w", encoding='utf-8') as f:
+                    f.write("".join(failing))
+                done = True
+            else:
+                print("No failing test!")
+        else:
+            output = run_command(test_command)
             print(output)
-            target_file = project_path + "/failing_tests"
-            destination = data_path + f"/results/failing_tests__{t}__{parsed['ID']}"
-            
+
             if os.path.isfile(target_file):
                 shutil.copy2(target_file, destination)
-                well_done_count+=1
+                done = True
             else:
                 print("No failing test!")
-            reset(p)
+    finally:
+        restore_workspace(project_path, original_path, touched=[target_file_path])
+    return done
+
+
+def run_mutant_job(ledger, key, *args):
+    """
+    run_mutant(*args), through the ledger when there is one: the mutant's "test" row is
+    recorded as done only when run_mutant returns, and errors are retried with backoff
+    (see job_ledger.run_job). Without a ledger an error is printed.
+
+    Returns:
+      (bool, bool): whether failing tests were collected, and whether the mutant
+                    still ended in an error.
+    """
+    if ledger:
+        status, done = run_job(ledger, key, run_mutant, *args)
+        return bool(done), status == "failed"
+    try:
+        return run_mutant(*args), False
+    except Exception as e:
+        print(e)
+        return False, True
+
+
+def select_tests(line_index, parsed):
+    """
+    Tests to run for a mutant according to the suite coverage index (see
+    build_line_test_index): those that reach the mutated line, plus those whose
+    coverage is unknown.
+
+    Returns None to fall back to the full suite when there is no complete index, when
+    the line belongs to a static initializer, or when more than MAX_SELECTED_TESTS tests
+    are selected (one suite run is then cheaper than a run per test). Returns [] when
+    no test reaches the line, so the mutant cannot fail any test.
+    """
+    if line_index is None or parsed is None:
+        return None
+    lineno = parsed['lineno']
+    if lineno in line_index["static"]:
+        print(f"Line {lineno} is in a static initializer, running the full suite")
+        return None
+    tests = sorted(set(line_index["lines"].get(lineno, [])).union(line_index["unknown"]))
+    if len(tests) > MAX_SELECTED_TESTS:
+        print(f"{len(tests)} tests reach line {lineno}, running the full suite")
+        return None
+    print(f"{len(tests)} tests reach line {lineno}")
+    return tests
+
+
+def build_data_from_mutation(p,t,n,incremental=False,coverage_guided=False,ledger=None):
+    """
+    Run up to n FAIL mutants of class t one after another and collect their failing tests.
+
+    With a ledger, every mutant is its own job: mutants already done are skipped, and if
+    any mutant still fails after its retries a RuntimeError is raised, so the class-level
+    job is not marked done either.
+    """
+    selected = select_mutants(p,t,n,random.Random(f"{p}:{t}") if ledger else random)
+    if selected is None:
+        return 0
+    parsed_mutants, target_file_path = selected
+    parsed_mutants = [parsed for parsed in parsed_mutants if parsed is not None]
+
+    line_index = build_line_test_index(p,t) if coverage_guided else None
+
+    project_path, original_path = project_paths(p)
+    if incremental:
+        original_path = provision_baseline(p)
+
+    well_done_count = 0
+    failed_count = 0
+    for parsed in parsed_mutants:
+        key = (p, t, parsed['ID'], "test")
+        if ledger and is_done(ledger, key):
+            continue
+        tests = select_tests(line_index, parsed)
+        done, failed = run_mutant_job(ledger, key, p, t, parsed, project_path, original_path,
+                                      target_file_path, incremental, tests)
+        well_done_count += done
+        failed_count += failed
 
             #return 1
+    if ledger and failed_count:
+        raise RuntimeError(f"{t}: {failed_count} mutants failed")
+    return well_done_count
+
+
+def build_data_from_mutation_parallel(p,t,n,k,incremental=False,coverage_guided=False,ledger=None):
+    """
+    Same as build_data_from_mutation, but runs the selected mutants on k isolated
+    working copies (<project>_fixed_w0 .. _w{k-1}) at once.
+
+    Each worker checks a working copy out of a pool, runs one mutant in it and
+    hands it back, so no two mutants ever share a checkout. Results land in
+    mutation_data/<p>/results/ under the same names as the sequential version.
+    With a ledger, mutants already recorded as done are skipped, and failed mutants
+    are retried and reported as in build_data_from_mutation.
+    """
+    selected = select_mutants(p,t,n,random.Random(f"{p}:{t}") if ledger else random)
+    if selected is None:
+        return 0
+    parsed_mutants, target_file_path = selected
+    parsed_mutants = [parsed for parsed in parsed_mutants if parsed is not None]
+    if ledger:
+        parsed_mutants = [parsed for parsed in parsed_mutants
+                          if not is_done(ledger, (p, t, parsed['ID'], "test"))]
+
+    line_index = build_line_test_index(p,t) if coverage_guided else None
+
+    _, original_path = project_paths(p)
+    if incremental:
+        original_path = provision_baseline(p)
+    workspaces = queue.Queue()
+    for path in provision_workspaces(p, min(k, len(parsed_mutants)) or 1, original_path):
+        workspaces.put(path)
+
+    def task(parsed):
+        project_path = workspaces.get()
+        try:
+            tests = select_tests(line_index, parsed)
+            return run_mutant_job(ledger, (p, t, parsed['ID'], "test"), p, t, parsed, project_path,
+                                  original_path, target_file_path, incremental, tests)
+        finally:
+            workspaces.put(project_path)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=k) as executor:
+        results = list(executor.map(task, parsed_mutants))
+    elapsed = time.time() - start
+
+    well_done_count = sum(done for done, _ in results)
+    failed_count = sum(failed for _, failed in results)
+    print(f"{t}: {well_done_count}/{len(parsed_mutants)} mutants collected, {failed_count} failed, "
+          f"with {k} workers in {elapsed:.1f}s")
+    if ledger and failed_count:
+        raise RuntimeError(f"{t}: {failed_count} mutants failed")
+    return well_done_count
 #reset("Closure")
 #build_data_from_mutation("Closure", "com.google.javascript.jscomp.TypedScopeCreator", 35)
 #build_data_from_mutation("Closure", "com.google.javascript.jscomp.parsing.IRFactory", 35)
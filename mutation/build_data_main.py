@@ -1,14 +1,21 @@
 import csv
 
 from build_data import build_class_mutation_data
-from build_data_from_mutation import build_data_from_mutation
+from build_data_from_mutation import build_data_from_mutation, build_data_from_mutation_parallel
 
-from apply_coverage import apply_coverage
+from apply_coverage import apply_coverage, apply_coverage_parallel, collect_suite_coverage
+from job_ledger import open_ledger, run_job, report_progress
 
+# The packed coverage matrix needs NumPy; without it the extractors read the XML files
+try:
+    from coverage_matrix import build_coverage_matrix
+except ImportError:
+    build_coverage_matrix = None
 
 
 
-def build_data_main(p):
+
+def build_data_main(p, workers=1, incremental=False, coverage_guided=False, ledger_path=None, coverage_session=False):
     csv_path = f"/home/yinseok/lorafl/data_preprocess/data_original/{p}/classes.csv"
     rows = []
     try:
@@ -24,15 +31,66 @@ def build_data_main(p):
             target = r["packageName"]+"."+r["name"]
             targets.append(target)
 
+    # coverage_guided mutants only run the tests that reach the mutated line, which
+    # needs the per-test coverage of the whole suite first
+    if ledger_path:
+        ledger = open_ledger(ledger_path)
+        if coverage_guided:
+            run_job(ledger, (p, "*", "*", "suite_coverage"), collect_suite_coverage, p, workers, incremental)
+        for t in targets:
+            print(t)
+            if workers > 1:
+                run_job(ledger, (p, t, "*", "execute"), build_data_from_mutation_parallel,
+                        p, t, 30, workers, incremental, coverage_guided, ledger)
+            else:
+                run_job(ledger, (p, t, "*", "execute"), build_data_from_mutation,
+                        p, t, 30, incremental, coverage_guided, ledger)
+            if workers > 1:
+                run_job(ledger, (p, t, "*", "coverage"), apply_coverage_parallel, p, t, workers, incremental,
+                        coverage_session)
+            else:
+                run_job(ledger, (p, t, "*", "coverage"), apply_coverage, p, t, incremental, coverage_session)
+            report_progress(ledger, p)
+        pack_coverage(p)
+        return
+
+    if coverage_guided:
+        try:
+            collect_suite_coverage(p, workers, incremental)
+        except Exception as e:
+            print(e)
     for t in targets:
         print(t)
         try:
             #build_class_mutation_data(p,t)
-            build_data_from_mutation(p,t,30)
-            apply_coverage(p,t)
+            if workers > 1:
+                build_data_from_mutation_parallel(p,t,30,workers,incremental,coverage_guided)
+            else:
+                build_data_from_mutation(p,t,30,incremental,coverage_guided)
+            if workers > 1:
+                apply_coverage_parallel(p,t,workers,incremental,coverage_session)
+            else:
+                apply_coverage(p,t,incremental,coverage_session)
             #return
         except Exception as e:
             print(e)
+    pack_coverage(p)
+
+
+def pack_coverage(p):
+    """
+    Rebuild mutation_data/<p>/coverage_matrix.npz from the coverage files collected so far,
+    so extract_class_coverage / extract_method_coverage read the matrix instead of the XML.
+    """
+    if build_coverage_matrix is None:
+        print("NumPy unavailable, coverage matrix not built")
+        return
+    try:
+        print(build_coverage_matrix(p))
+    except FileNotFoundError as e:
+        print(e)
+
+
 build_data_main("Chart")
 #build_data_main("Math")
 build_data_main("Lang")
@@ -2,32 +2,26 @@ import csv
 
 from generate_classes_summary_prompt import generate_prompt_1,generate_prompt_2
 
-from generate_memory_fl_prompt import generate_prompt_2_1, generate_prompt_2_2
+from generate_memory_fl_prompt import generate_prompt_2_1, generate_prompt_2_2, exclude_non_existing, exclude_candidates, method_snippets
 
 from parse_failing_test import parse_failing_tests
 from extract_test_prompt import extract_test_prompt
 
 
 
-import glob
 import os
+import random
+
+from workspace import project_paths, restore_workspace
+from token_budget import count_tokens, pick_drops
+from source_files import source_dir, resolve_class_file, load_json
 
 
 MAX_TOKEN = 3000
 
 def find_matching_file(p, target_class):
-    target_class = target_class.split(".")[-1]
-    source_code_path = f"/home/yinseok/lorafl/data_preprocess/data_original/{p}/output_source/"
-    pattern = f"{target_class}_*.json"
-    matching_files = glob.glob(os.path.join(source_code_path, pattern))
-
-    # Filter only files where the suffix after class name is a number
-    for file in matching_files:
-        filename = os.path.basename(file)
-        suffix = filename.removeprefix(f"{target_class}_").removesuffix(".json")
-        if suffix.isdigit():
-            return file  # Return first match
-    return None
+    # <Class>_<n>.json in output_source, preferring the one whose package matches target_class
+    return resolve_class_file(source_dir(p), target_class, numbered=True)
 
 def parse_log_data(log_data):
     try:
@@ -53,25 +47,8 @@ def parse_log_data(log_data):
 
 
 def reset(p):
-    if p=="Closure":
-        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
-        original_path = "/home/yinseok/ttr_1/temp/Closure_1/Closure_1_fixed"
-
-    for item in os.listdir(project_path):
-        item_path = os.path.join(project_path, item)
-        if os.path.isfile(item_path) or os.path.islink(item_path):
-            os.unlink(item_path)
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
-
-    # Copy everything from original_path to project_path
-    for item in os.listdir(original_path):
-        s = os.path.join(original_path, item)
-        d = os.path.join(project_path, item)
-        if os.path.isdir(s):
-            shutil.copytree(s, d)
-        else:
-            shutil.copy2(s, d)
+    project_path, original_path = project_paths(p)
+    restore_workspace(project_path, original_path)
 
 
 
@@ -115,32 +92,45 @@ def apply_mutation(target_file_path: str, parsed: dict) -> None:
         file.writelines(lines)
 
 
-import math
-import re
-
-def approx_token_count(text: str,
-                       avg_chars_per_token: float = 4.0) -> int:
+def method_input_prompt(test_prompt, method_prompt, choices_count):
     """
-    Approximate the number of LLaMA‑3 tokens in `text` by:
-      1) taking its character length divided by avg_chars_per_token, AND
-      2) making sure we never undercount very short strings.
-
-    Args:
-      text: your prompt + completion string
-      avg_chars_per_token: empirical average chars per token (~3.7–4.2).
-                           4.0 is a safe default.
-    Returns:
-      An integer estimate of token count.
+    Stage 2 (method level FL) input prompt around the failing test and the target class code.
     """
-    # 1) Base on raw character count
-    char_based = len(text) / avg_chars_per_token
+    if choices_count>=1:
+        return f"""
+You are a debugging assistant. After reviewing the failing test case that exposed the bug, and a buggy class, I want you to select up to {choices_count} methods that most likely contain the bug.
+
+Instructions:
+1. You may **ONLY** choose methods from the list under ##EXISTING_METHODS. This list contains all valid method names and line numbers.
+2. Your output must **STRICTLY** follow the format under ##OUTPUT_FORMAT. Replace the placeholders with actual method names and line numbers from ##EXISTING_METHODS.
+3. You must return **at most** {choices_count} lines. If fewer methods are relevant based on ##EXISTING_METHODS, return only those.
+
+##Failing test case that triggered the bug:
+{test_prompt}
+
+##target class (each method with its name and line number shown at the beginning)
+{method_prompt}
+
+##OUTPUT_FORMAT (replace <methodName>,<lineno> with actual method name and line number from ##EXISTING_METHODS):
+{chr(10).join(f"{i+1}.methodName@lineno" for i in range(choices_count))}
+
+Identify the {choices_count} methods most likely to contain the bug, and list them in order from most to least likely. :
+"""
+    else:
+        return f"""
+You are a debugging assistant. After reviewing the failing test case that exposed the bug and a buggy class, I want you to select one method that is most likely to have caused the bug and needs further investigation. Since your answer will be automatically handled, output ONLY the name and line number of the method, in the format specified below.
+
+Output format example (replace with actual method name and line number):
+1.<methodName@lineno>
+
+Failing test case that triggered the bug:
+{test_prompt}
 
-    # 2) Also consider splitting on whitespace to catch very short strings
-    word_count = len(re.findall(r"\S+", text))  # every non‑space chunk
-    word_based = word_count * 0.75               # ~0.75 tokens per word
+target class (each method with its name and line number shown at the beginning)
+{method_prompt}
 
-    # Use the larger estimate (safer upper bound), round up
-    return math.ceil(max(char_based, word_based, 1.0))
+List one method that is most likely to have caused the bug:
+"""
 
 
 
@@ -188,12 +178,13 @@ def build_dataset(p, data_list, choice,choices_count,coverage_data, file_path):
     parsed_ft = parse_failing_tests(ft_file_path)
     target_ft = parsed_ft[bug_index]
     
-    my_set = set()   # create empty set
+    # Failing test classes in first-seen order; a set's order changes with the hash seed
+    test_classes = {}
 
     for parsed in parsed_ft:
-        my_set.add(parsed[0][0].split(".")[-1])  # add element to set
+        test_classes.setdefault(parsed[0][0].split(".")[-1], None)
 
-    total = ",".join(my_set)  # join set elements with comma
+    total = ",".join(test_classes)  # join test class names with comma
 
 
     ft,_,index = ft_file_path.split("/")[-1].split("__")    
@@ -280,8 +271,7 @@ List {choices_count} number of classes that need further investigation, ordered
         
         source_code_file_path = find_matching_file(p,target_class)
 
-        with open(source_code_file_path, 'r') as f:
-            source_data = json.load(f)
+        source_data = load_json(source_code_file_path)
         
         if "@" not in parsed_log["location"]:
             print("Mutation not located within method")
@@ -291,73 +281,36 @@ List {choices_count} number of classes that need further investigation, ordered
 
 
 
-        exclude = 0
-        prev= 0
-        same = 0
+        # Methods to leave out of the prompt; grown until the prompt fits MAX_TOKEN.
+        # The first render keeps every method. If it is too long, each droppable method
+        # is costed once from its own snippet, and the shortest prefix of a random order
+        # that covers the overflow is dropped. The re-rendered prompt is counted again,
+        # since snippets can share lines, and more methods are dropped only if needed.
+        drops = []
+        order = None
         while(True):
-            method_prompt, answer, coverage_data, file_path = generate_prompt_2_1(p,target_class,target_ft[0][0],target_ft[0][1],parsed_log,source_data,exclude,choices_count,coverage_data, file_path)
+            method_prompt, answer, coverage_data, file_path = generate_prompt_2_1(p,target_class,target_ft[0][0],target_ft[0][1],parsed_log,source_data,drops,choices_count,coverage_data, file_path)
 
             if method_prompt==-1 or answer==-1:
                 return -1
-            if choices_count>=1:
-                input_prompt = f"""
-You are a debugging assistant. After reviewing the failing test case that exposed the bug, and a buggy class, I want you to select up to {choices_count} methods that most likely contain the bug.
-
-Instructions:
-1. You may **ONLY** choose methods from the list under ##EXISTING_METHODS. This list contains all valid method names and line numbers.
-2. Your output must **STRICTLY** follow the format under ##OUTPUT_FORMAT. Replace the placeholders with actual method names and line numbers from ##EXISTING_METHODS.
-3. You must return **at most** {choices_count} lines. If fewer methods are relevant based on ##EXISTING_METHODS, return only those.
-
-##Failing test case that triggered the bug:
-{test_prompt}
-
-##target class (each method with its name and line number shown at the beginning)
-{method_prompt}
+            input_prompt = method_input_prompt(test_prompt, method_prompt, choices_count)
 
-##OUTPUT_FORMAT (replace <methodName>,<lineno> with actual method name and line number from ##EXISTING_METHODS):
-{chr(10).join(f"{i+1}.methodName@lineno" for i in range(choices_count))}
-
-Identify the {choices_count} methods most likely to contain the bug, and list them in order from most to least likely. :
-"""
-            else:
-                input_prompt = f"""
-You are a debugging assistant. After reviewing the failing test case that exposed the bug and a buggy class, I want you to select one method that is most likely to have caused the bug and needs further investigation. Since your answer will be automatically handled, output ONLY the name and line number of the method, in the format specified below.
-
-Output format example (replace with actual method name and line number):
-1.<methodName@lineno>
-
-Failing test case that triggered the bug:
-{test_prompt}
-
-target class (each method with its name and line number shown at the beginning)
-{method_prompt}
-
-List one method that is most likely to have caused the bug:
-"""
-
-
-            count = approx_token_count(input_prompt)
-            count += approx_token_count(answer)
-            
-            if prev==count:
-                same+=1
-                if same==3:
-                    return -1
-            else:
-                prev = count
-                same = 0
-            
+            count = count_tokens(input_prompt)
+            count += count_tokens(answer)
 
             if count < MAX_TOKEN:
                 break
-            
-            if count>20000:
-                exclude+=15
-            elif count>7000:
-                exclude+=7
-            elif count>4000:
-                exclude+=2
-            exclude+=1
+
+            if order is None:
+                kept = exclude_non_existing(coverage_data, source_data)
+                order = exclude_candidates(kept, parsed_log)
+                random.shuffle(order)
+                costs = {key: count_tokens(text) for key, text in method_snippets(kept, source_data).items()}
+
+            remaining = order[len(drops):]
+            if not remaining:
+                return -1
+            drops = drops + pick_drops(remaining, costs, count - MAX_TOKEN + 1)
         
         return input_prompt, answer, coverage_data, file_path
 
@@ -371,72 +324,123 @@ List one method that is most likely to have caused the bug:
 
 import csv
 import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from jsonl_writer import JsonlWriter
+
+
+def build_row_records(p, i, row, choice_counts, choice, seed=None):
+    """
+    Build every {"input","output"} record for one row of data_output2.csv.
+
+    Parameters:
+        p : Project Name
+        i (int): 1-based row number (header excluded)
+        row (List): the CSV row, including the two trailing stage flags
+        choice_counts (List[int]): choice counts to generate for this row
+        choice (int): 1 = stage 1 rows, 2 = stage 2 rows, 3 = stage 2 for rows flagged for either stage
+        seed : if not None, the global `random` state is reseeded from (seed, p, i) first, so
+               select_classes / exclude_method / return_answer give the same result for this
+               row no matter which process builds it or in which order.
+    Returns:
+        (i, records)
+    """
+    if seed is not None:
+        random.seed(f"{seed}:{p}:{i}")
 
+    records = []
+    coverage_data = None
+    file_path = None
 
-def build_dataset_main(p,csv_file_path, output_jsonl_path,choice_counts,choice):
-    results = []
+    if row[-2] == '1' and choice==1:  # if 'a' == 1
+        print(i)
+        filtered_row = row[:-2]  # remove 'a' and 'b'
+        
+        for cc in choice_counts:
+            try:
+                rv = build_dataset(p,filtered_row,1,cc,coverage_data,file_path)
+                if rv==-1:
+                    continue
+                input_prompt, output_prompt,coverage_data, file_path = rv
+            except Exception as e:
+                print(e)
+                continue
+
+            if input_prompt != -1:
+                records.append({
+                    "input": input_prompt,
+                    "output": output_prompt
+                })
+
+    if (row[-1] == "1" and choice==2) or (choice==3 and (row[-1]=="1" or row[-2] == "1")):
+        print(i)
+        filtered_row = row[:-2]
+        for cc in choice_counts:
+            try:
+            
+                rv = build_dataset(p,filtered_row,2,cc,coverage_data, file_path)
+                if rv==-1:
+                    continue
+                input_prompt, output_prompt, coverage_data, file_path = rv
+            except Exception as e:
+                print(e)
+                continue
+
+            if input_prompt != -1:
+                records.append({
+                    "input" : input_prompt,
+                    "output" : output_prompt
+                })
+
+    return i, records
+
+
+def build_dataset_main(p,csv_file_path, output_jsonl_path,choice_counts,choice, workers=1, seed=None, resume=True):
+    """
+    Build the JSONL dataset for project p from csv_file_path.
+
+    With workers > 1, rows are sharded across a process pool. Every row is seeded from
+    (seed, p, row number) -- seed defaults to 0 in that mode -- so the output is the same
+    for any number of workers. Records are written in CSV order as soon as each row's
+    results are available.
+
+    Output is streamed through JsonlWriter: output_jsonl_path only appears once every
+    row is done, and with resume=True an interrupted run continues after the last row
+    that was flushed, as long as it was started with the same csv, choice_counts, choice
+    and seed; otherwise the leftover output is discarded.
+    """
     #choice_counts = [1,2,3]
     #choice_counts = [3]
     with open(csv_file_path, newline='') as csvfile:
         reader = csv.reader(csvfile)
         header = next(reader)  # skip header
-        i = 0
-        
-        coverage_data = None
-        file_path = None
-
-
-        for row in reader:
-            i+=1
-            if row[-2] == '1' and choice==1:  # if 'a' == 1
-                print(i)
-                filtered_row = row[:-2]  # remove 'a' and 'b'
-                
-                for cc in choice_counts:
-                    try:
-                        rv = build_dataset(p,filtered_row,1,cc,coverage_data,file_path)
-                        if rv==-1:
-                            continue
-                        input_prompt, output_prompt,coverage_data, file_path = rv
-                    except Exception as e:
-                        print(e)
-                        continue
-
-                    if input_prompt != -1:
-                        results.append({
-                            "input": input_prompt,
-                            "output": output_prompt
-                        })
-
-            if (row[-1] == "1" and choice==2) or (choice==3 and (row[-1]=="1" or row[-2] == "1")):
-                print(i)
-                filtered_row = row[:-2]
-                for cc in choice_counts:
-                    try:
-                    
-                        rv = build_dataset(p,filtered_row,2,cc,coverage_data, file_path)
-                        if rv==-1:
-                            continue
-                        input_prompt, output_prompt, coverage_data, file_path = rv
-                    except Exception as e:
-                        print(e)
-                        continue
-
-                    if input_prompt != -1:
-                        results.append({
-                            "input" : input_prompt,
-                            "output" : output_prompt
-                        })
-
-    with open(output_jsonl_path, 'w') as f:
-        for item in results:
-            json.dump(item, f, ensure_ascii=False)
-            f.write('\n')
-
-build_dataset_main("Closure", "Closure/data_output2_fixed.csv", "Closure/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
-build_dataset_main("Chart", "Chart/data_output2.csv", "Chart/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
-build_dataset_main("Lang", "Lang/data_output2.csv", "Lang/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
-build_dataset_main("Time", "Time/data_output2.csv", "Time/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
+        rows = list(reader)
+
+    if workers > 1 and seed is None:
+        seed = 0
+
+    params = {"p": p, "csv": os.path.abspath(csv_file_path), "choice_counts": choice_counts,
+              "choice": choice, "seed": seed}
+    with JsonlWriter(output_jsonl_path, resume=resume, params=params) as writer:
+        todo = [(i, row) for i, row in enumerate(rows, start=1) if i > writer.last_row]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(build_row_records, repeat(p), [i for i, _ in todo], [row for _, row in todo],
+                                       repeat(choice_counts), repeat(choice), repeat(seed), chunksize=4)
+                for i, records in results:
+                    writer.write_row(i, records)
+        else:
+            for i, row in todo:
+                _, records = build_row_records(p, i, row, choice_counts, choice, seed)
+                writer.write_row(i, records)
+
+if __name__ == "__main__":
+    build_dataset_main("Closure", "Closure/data_output2_fixed.csv", "Closure/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
+    build_dataset_main("Chart", "Chart/data_output2.csv", "Chart/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
+    build_dataset_main("Lang", "Lang/data_output2.csv", "Lang/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
+    build_dataset_main("Time", "Time/data_output2.csv", "Time/train_data_s2_123_v3_5000.jsonl", [1,2,3,3,4,5],3)
 
 import time
 
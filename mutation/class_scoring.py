@@ -0,0 +1,111 @@
+import numpy as np
+
+
+METRIC_KEYS = [
+    "hit_rate",
+    "lines_coverage",
+    "methods_coverage",
+    "total_lines",
+    "method_count",
+    "naive_covered_lines",
+    "naive_total_line_hits",
+    "naive_covered_methods"
+]
+
+DEFAULT_WEIGHTS = {
+    "hit_rate": 1.0,
+    "lines_coverage": 1.0,
+    "methods_coverage": 1.0,
+    "total_lines": 0,
+    "method_count": 0,
+    "naive_covered_lines": 0.5,
+    "naive_total_line_hits": 0.5,
+    "naive_covered_methods": 0.5
+}
+
+
+def metric_matrix(data):
+    """
+    Build the classes x METRIC_KEYS array for the classes in data with covered_lines > 0.
+
+    Parameters:
+        data (dict): class -> {total_lines, method_count, covered_lines, total_line_hits, covered_methods}
+    Returns:
+        (list of str, np.ndarray): class names and their float64 metric rows.
+    """
+    classes = [cls for cls, info in data.items() if info["covered_lines"] > 0]
+    raw = np.array(
+        [[data[cls]["total_lines"], data[cls]["method_count"], data[cls]["covered_lines"],
+          data[cls]["total_line_hits"], data[cls]["covered_methods"]] for cls in classes],
+        dtype=np.float64,
+    ).reshape(len(classes), 5)
+    total_lines, method_count, covered_lines, total_line_hits, covered_methods = raw.T
+
+    # Percentage-based indicators are 0 where the denominator is 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hit_rate = np.where(total_lines > 0, total_line_hits / total_lines, 0.0)
+        lines_coverage = np.where(total_lines > 0, covered_lines / total_lines, 0.0)
+        methods_coverage = np.where(method_count > 0, covered_methods / method_count, 0.0)
+
+    matrix = np.column_stack([
+        hit_rate, lines_coverage, methods_coverage, total_lines, method_count,
+        covered_lines, total_line_hits, covered_methods,
+    ])
+    return classes, matrix
+
+
+def _weight_vector(weights):
+    merged = dict(DEFAULT_WEIGHTS)
+    if weights is not None:
+        merged.update(weights)
+    return np.array([merged[key] for key in METRIC_KEYS], dtype=np.float64)
+
+
+def _weighted(norm, w):
+    # Accumulate column by column, in METRIC_KEYS order, so scores match the old per-class loop exactly
+    acc = np.zeros(norm.shape[0])
+    for j in range(norm.shape[1]):
+        acc += w[j] * norm[:, j]
+    return acc / w.sum()
+
+
+def _normalize(matrix, mn, mx):
+    # Min-max scale each column to [0, 1]; a constant column counts as maximum importance (1.0)
+    span = mx - mn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(span == 0, 1.0, (matrix - mn) / np.where(span == 0, 1.0, span))
+
+
+def score_classes(data, weights=None):
+    """
+    Score each class on how related it is to the bug using both percentage-based and naive (absolute) indicators.
+
+    Indicators used:
+      - Percentage-based:
+          * hit_rate: total_line_hits / total_lines
+          * lines_coverage: covered_lines / total_lines
+          * methods_coverage: covered_methods / method_count
+      - Absolute size indicators:
+          * total_lines: absolute value for class size/complexity
+          * method_count: absolute value for class size/complexity
+      - Naive (absolute) coverage counts:
+          * naive_covered_lines: raw covered_lines
+          * naive_total_line_hits: raw total_line_hits
+          * naive_covered_methods: raw covered_methods
+
+    Classes with covered_lines == 0 are excluded.
+
+    The metrics are built into one classes x metrics array, min-max normalized per
+    column across the remaining classes and combined with `weights` (metric -> weight,
+    overriding DEFAULT_WEIGHTS) into a score in [0, 1].
+
+    Returns:
+      A dictionary mapping class names to their normalized score.
+    """
+    classes, matrix = metric_matrix(data)
+    if not classes:
+        return {}
+    norm = _normalize(matrix, matrix.min(axis=0), matrix.max(axis=0))
+    scores = _weighted(norm, _weight_vector(weights))
+    return dict(zip(classes, scores.tolist()))
+
@@ -0,0 +1,35 @@
+import csv
+import os
+from functools import lru_cache
+
+
+def classes_csv_path(p):
+    return f"/home/yinseok/lorafl/data/{p}/classes.csv"
+
+
+@lru_cache(maxsize=32)
+def _load(path, mtime_ns, prefix):
+    summaries = {}
+    with open(path, 'r') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        for row in reader:
+            # Keep the first row for a name, as file_names.index() did
+            summaries.setdefault(prefix + row[0].strip(), row[1].strip())
+    return summaries
+
+
+def load_class_summaries(path, prefix=""):
+    """
+    Read a classes.csv (header, then "<package path>.java,<summary>" rows) into a dict.
+
+    Parameters:
+        path (str): path to classes.csv
+        prefix (str): prepended to every file name, e.g. "com.google." for Closure
+    Returns:
+        dict: file name -> summary. Loaded once per (path, prefix) and reloaded only
+              when the file changes; the dict is shared, so do not modify it.
+    Raises:
+        FileNotFoundError: if path does not exist.
+    """
+    return _load(path, os.stat(path).st_mtime_ns, prefix)
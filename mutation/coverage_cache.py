@@ -0,0 +1,92 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+
+CACHE_DIR = "/home/yinseok/lorafl/mutation_data/.coverage_cache"
+MAX_DISK_ENTRIES = 50000
+MAX_MEMORY_ENTRIES = 512
+
+# key -> pickled result; results are unpickled on every hit so callers never share objects
+_memory = OrderedDict()
+_writes = 0
+
+
+def cache_key(kind, file_paths, *args):
+    """
+    Key for a parsed result: the parser kind, every input file's path, mtime and size,
+    and any extra arguments (e.g. the target class). Rewriting a coverage file changes
+    its mtime, so stale entries are never returned.
+    """
+    h = hashlib.sha1(kind.encode())
+    for path in file_paths:
+        st = os.stat(path)
+        h.update(f"\0{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}".encode())
+    for arg in args:
+        h.update(f"\0{arg!r}".encode())
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".pkl")
+
+
+def _evict_disk():
+    """
+    Drop the least recently used entries once the cache holds more than MAX_DISK_ENTRIES.
+    Hits touch the entry's mtime, so mtime order is recency order.
+    """
+    entries = []
+    for sub in os.scandir(CACHE_DIR):
+        if sub.is_dir():
+            for entry in os.scandir(sub.path):
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+    if len(entries) <= MAX_DISK_ENTRIES:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - MAX_DISK_ENTRIES]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def cached(kind, file_paths, compute, *args):
+    """
+    Return compute(*args), memoized in memory and on disk under cache_key(kind, file_paths, *args).
+    """
+    global _writes
+    key = cache_key(kind, file_paths, *args)
+
+    blob = _memory.get(key)
+    if blob is not None:
+        _memory.move_to_end(key)
+        return pickle.loads(blob)
+
+    path = _entry_path(key)
+    try:
+        with open(path, "rb") as f:
+            blob = f.read()
+        os.utime(path)
+    except (FileNotFoundError, OSError):
+        blob = None
+
+    if blob is None:
+        blob = pickle.dumps(compute(*args), protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+            _writes += 1
+            if _writes % 500 == 0:
+                _evict_disk()
+        except OSError as e:
+            print(f"Coverage cache write failed: {e}")
+
+    _memory[key] = blob
+    if len(_memory) > MAX_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+    return pickle.loads(blob)
@@ -0,0 +1,290 @@
+"""
+A project's per-test coverage packed into one sparse tests x lines hit matrix.
+
+Columns ("entries") are the <line> elements of the Cobertura reports, in report order.
+As in parse_coverage, a line listed both under a method and directly under its class
+is two entries. Per entry we keep:
+  entry_class:  index into `classes`
+  entry_method: index into `methods`, or -1 for the class-level <lines> block
+  entry_line:   source line number
+
+Rows are coverage files (one test run each), stored in CSR form (indptr, indices, hits)
+with only non-zero hit counts kept. Class-, method- and line-level aggregates are then
+bincount/unique reductions over the selected rows instead of XML walks.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+def matrix_path(p):
+    return f"/home/yinseok/lorafl/mutation_data/{p}/coverage_matrix.npz"
+
+
+def _read_entries(file_path):
+    """
+    Stream one coverage XML and yield
+    (package, class_name, method_ordinal, method_name, position, line_number, hits)
+    for every <line>. method_ordinal is -1 for class-level lines and position counts
+    lines within their block, so the tuple prefix identifies the entry across files.
+    Every <class> and <method> is also announced once with line_number and hits None,
+    so classes and methods without lines are still known.
+    """
+    stack = []
+    package = None
+    class_name = None
+    method_ordinal = -1
+    method_name = None
+    position = 0
+
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            if stack[1:] == ['packages', 'package']:
+                package = elem.attrib.get('name')
+            elif stack[1:] == ['packages', 'package', 'classes', 'class']:
+                class_name = elem.attrib.get('name')
+                method_ordinal = -1
+                next_ordinal = 0
+                yield (package, class_name, -1, None, -1, None, None)
+            elif class_name is not None and stack[5:] == ['methods', 'method']:
+                method_ordinal = next_ordinal
+                next_ordinal += 1
+                method_name = elem.attrib.get('name')
+                yield (package, class_name, method_ordinal, method_name, -1, None, None)
+            elif class_name is not None and elem.tag == 'lines':
+                position = 0
+            continue
+
+        tag = stack.pop()
+        if tag == 'line' and class_name is not None:
+            in_method = stack[5:] == ['methods', 'method', 'lines']
+            if in_method or stack[5:] == ['lines']:
+                yield (package, class_name,
+                       method_ordinal if in_method else -1,
+                       method_name if in_method else None,
+                       position,
+                       int(elem.attrib.get('number')),
+                       int(elem.attrib.get('hits', '0')))
+                position += 1
+            elem.clear()
+        elif tag == 'method' and stack[5:] == ['methods']:
+            method_ordinal = -1
+            elem.clear()
+        elif tag == 'class' and len(stack) == 4:
+            class_name = None
+            elem.clear()
+
+
+def build_coverage_matrix(p, coverage_files=None):
+    """
+    Pack every coverage__<class>__<test>.xml of project p into coverage_matrix.npz.
+
+    Parameters:
+      p (str): project name.
+      coverage_files (list of str): file names to pack; defaults to the whole coverage directory.
+
+    Returns:
+      str: path of the written .npz file.
+    """
+    coverage_path = f"/home/yinseok/lorafl/mutation_data/{p}/coverage"
+    coverage_mtime = os.stat(coverage_path).st_mtime_ns
+    if coverage_files is None:
+        coverage_files = sorted(
+            entry.name for entry in os.scandir(coverage_path)
+            if entry.name.startswith("coverage__") and entry.name.endswith(".xml")
+        )
+
+    packages, package_ids = [], {}
+    classes, class_ids, class_package = [], {}, []
+    methods, method_ids, method_class = [], {}, []
+    entry_ids = {}
+    entry_class, entry_method, entry_line = [], [], []
+
+    indptr = [0]
+    indices = []
+    hits = []
+
+    for file in coverage_files:
+        print(f"Packing {file}")
+        for package, class_name, ordinal, method_name, position, line_number, h in _read_entries(os.path.join(coverage_path, file)):
+            if line_number is None:
+                # A <class> or <method> announcement
+                if package not in package_ids:
+                    package_ids[package] = len(packages)
+                    packages.append(package)
+                if class_name not in class_ids:
+                    class_ids[class_name] = len(classes)
+                    classes.append(class_name)
+                    class_package.append(package_ids[package])
+                if ordinal >= 0 and (class_name, ordinal) not in method_ids:
+                    method_ids[(class_name, ordinal)] = len(methods)
+                    methods.append(method_name)
+                    method_class.append(class_ids[class_name])
+                continue
+
+            key = (class_name, ordinal, position)
+            col = entry_ids.get(key)
+            if col is None:
+                col = entry_ids[key] = len(entry_class)
+                entry_class.append(class_ids[class_name])
+                entry_method.append(method_ids[(class_name, ordinal)] if ordinal >= 0 else -1)
+                entry_line.append(line_number)
+            if h:
+                indices.append(col)
+                hits.append(h)
+        indptr.append(len(indices))
+
+    path = matrix_path(p)
+    np.savez_compressed(
+        path,
+        tests=np.array(coverage_files, dtype=str),
+        packages=np.array(packages, dtype=str),
+        classes=np.array(classes, dtype=str),
+        class_package=np.array(class_package, dtype=np.int32),
+        methods=np.array(methods, dtype=str),
+        method_class=np.array(method_class, dtype=np.int32),
+        entry_class=np.array(entry_class, dtype=np.int32),
+        entry_method=np.array(entry_method, dtype=np.int32),
+        entry_line=np.array(entry_line, dtype=np.int32),
+        indptr=np.array(indptr, dtype=np.int64),
+        indices=np.array(indices, dtype=np.int32),
+        hits=np.array(hits, dtype=np.int64),
+        coverage_mtime=np.array(coverage_mtime, dtype=np.int64),
+    )
+    return path
+
+
+_loaded = {}
+
+
+def load_coverage_matrix(p):
+    """
+    Load project p's matrix, or return None if it is missing or older than the coverage directory.
+    """
+    path = matrix_path(p)
+    coverage_path = f"/home/yinseok/lorafl/mutation_data/{p}/coverage"
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        coverage_mtime = os.stat(coverage_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        with np.load(path) as data:
+            matrix = {key: data[key] for key in data.files}
+        matrix["class_total_lines"] = np.bincount(matrix["entry_class"], minlength=len(matrix["classes"]))
+        matrix["class_method_count"] = np.bincount(matrix["method_class"], minlength=len(matrix["classes"]))
+        matrix["method_total_lines"] = np.bincount(matrix["entry_method"] + 1, minlength=len(matrix["methods"]) + 1)[1:]
+        cached = _loaded[path] = (mtime, matrix)
+
+    matrix = cached[1]
+    if int(matrix["coverage_mtime"]) != coverage_mtime:
+        return None
+    return matrix
+
+
+def rows_for_class(matrix, t):
+    """
+    Row numbers of the coverage files collected for target class t (coverage__<t>__*.xml).
+    """
+    prefix = f"coverage__{t}__"
+    return np.flatnonzero(np.char.startswith(matrix["tests"], prefix))
+
+
+def _gather(matrix, rows):
+    """
+    (row_of_nonzero, entry_of_nonzero, hits_of_nonzero) for the given rows.
+    """
+    indptr = matrix["indptr"]
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    if lengths.sum() == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    row_ids = np.repeat(np.arange(len(rows)), lengths)
+    return row_ids, matrix["indices"][offsets], matrix["hits"][offsets]
+
+
+def class_coverage(matrix, rows):
+    """
+    Same result as combine_coverage_files over the given rows: per class, total_lines and
+    method_count of the class, with covered_lines, total_line_hits and covered_methods
+    summed over the rows.
+    """
+    if len(rows) == 0:
+        return {}
+    n_classes = len(matrix["classes"])
+    row_ids, cols, hits = _gather(matrix, rows)
+    cls = matrix["entry_class"][cols]
+
+    covered_lines = np.bincount(cls, minlength=n_classes)
+    total_line_hits = np.bincount(cls, weights=hits, minlength=n_classes).astype(np.int64)
+
+    methods = matrix["entry_method"][cols]
+    in_method = methods >= 0
+    covered = np.unique(row_ids[in_method] * len(matrix["methods"]) + methods[in_method]) % max(len(matrix["methods"]), 1)
+    covered_methods = np.bincount(matrix["method_class"][covered], minlength=n_classes)
+
+    return {
+        name: {
+            'total_lines': int(matrix["class_total_lines"][i]),
+            'method_count': int(matrix["class_method_count"][i]),
+            'covered_lines': int(covered_lines[i]),
+            'total_line_hits': int(total_line_hits[i]),
+            'covered_methods': int(covered_methods[i]),
+        }
+        for i, name in enumerate(matrix["classes"].tolist())
+    }
+
+
+def method_coverage(matrix, rows, target_class_name):
+    """
+    Same result as combine_methods_coverage over the given rows for the classes whose
+    name contains target_class_name (within the first package that has one, like
+    parse_methods_coverage with stop_early).
+    """
+    if len(rows) == 0:
+        return {}
+    class_names = matrix["classes"]
+    matched = np.flatnonzero(np.char.find(class_names, target_class_name) >= 0)
+    if len(matched) == 0:
+        return {}
+    matched = matched[matrix["class_package"][matched] == matrix["class_package"][matched[0]]]
+
+    method_ids = np.flatnonzero(np.isin(matrix["method_class"], matched))
+    n_methods = len(matrix["methods"])
+
+    row_ids, cols, hits = _gather(matrix, rows)
+    methods = matrix["entry_method"][cols]
+    in_method = methods >= 0
+    covered_lines = np.bincount(methods[in_method], minlength=n_methods)
+    total_line_hits = np.bincount(methods[in_method], weights=hits[in_method], minlength=n_methods).astype(np.int64)
+
+    entry_method = matrix["entry_method"]
+    entry_line = matrix["entry_line"]
+    selected = np.isin(entry_method, method_ids)
+    start_line = np.full(n_methods, np.iinfo(np.int32).max)
+    end_line = np.full(n_methods, -1)
+    np.minimum.at(start_line, entry_method[selected], entry_line[selected])
+    np.maximum.at(end_line, entry_method[selected], entry_line[selected])
+
+    methods_coverage = {}
+    method_counter = {}
+    names = matrix["methods"]
+    for m in method_ids.tolist():
+        base_key = str(names[m])
+        method_counter[base_key] = method_counter.get(base_key, 0) + 1
+        has_lines = matrix["method_total_lines"][m] > 0
+        methods_coverage[f"{base_key}#{method_counter[base_key]}"] = {
+            'total_lines': int(matrix["method_total_lines"][m]),
+            'covered_lines': int(covered_lines[m]),
+            'total_line_hits': int(total_line_hits[m]),
+            'start_line': int(start_line[m]) if has_lines else None,
+            'end_line': int(end_line[m]) if has_lines else None
+        }
+    return methods_coverage
@@ -1,5 +1,15 @@
 import xml.etree.ElementTree as ET
 import os
+
+from coverage_cache import cached
+from file_index import files_for_class
+
+# The packed coverage matrix needs NumPy; without it everything is read from XML
+try:
+    from coverage_matrix import load_coverage_matrix, rows_for_class, class_coverage
+except ImportError:
+    load_coverage_matrix = None
+
 def parse_coverage(file_path):
     """
     Parse a Cobertura-style coverage XML file to extract coverage information for each class.
@@ -16,58 +26,56 @@ def parse_coverage(file_path):
     
     Returns:
       dict: Mapping of class names to a dictionary with the above coverage information.
+
+    The file is read with iterparse and every <line>, <method> and <class> element is
+    cleared as soon as it has been counted, so memory stays bounded by one class
+    regardless of how many classes the report covers.
     """
-    tree = ET.parse(file_path)
-    root = tree.getroot()
     coverage_info = {}
-    
-    # Get all <package> elements
-    packages = root.find('packages')
-    if packages is None:
-        return coverage_info  # Return empty if no packages found.
-    
-    for package in packages.findall('package'):
-        classes = package.find('classes')
-        if classes is None:
+
+    # Tags of the currently open elements, root first
+    stack = []
+    class_name = None
+    in_method = False
+
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            if stack[1:] == ['packages', 'package', 'classes', 'class']:
+                # New <class>: start counting
+                class_name = elem.attrib.get('name')
+                total_lines = 0
+                method_count = 0
+                covered_lines = 0
+                total_line_hits = 0
+                covered_methods = 0
+            elif class_name is not None and stack[5:] == ['methods', 'method']:
+                method_count += 1
+                method_has_coverage = False
+                in_method = True
+            continue
+
+        tag = stack.pop()
+        if class_name is None:
             continue
-        
-        # Process each <class> element
-        for clazz in classes.findall('class'):
-            class_name = clazz.attrib.get('name')
-            total_lines = 0
-            method_count = 0
-            covered_lines = 0
-            total_line_hits = 0
-            covered_methods = 0
-            
-            # Process any lines defined directly inside the class (outside methods)
-            class_lines_elem = clazz.find('lines')
-            if class_lines_elem is not None:
-                for line in class_lines_elem.findall('line'):
-                    total_lines += 1
-                    hits = int(line.attrib.get('hits', '0'))
-                    total_line_hits += hits
-                    if hits > 0:
-                        covered_lines += 1
-            
-            # Process the methods inside the class
-            methods_elem = clazz.find('methods')
-            if methods_elem is not None:
-                for method in methods_elem.findall('method'):
-                    method_count += 1
-                    method_has_coverage = False
-                    method_lines_elem = method.find('lines')
-                    if method_lines_elem is not None:
-                        for line in method_lines_elem.findall('line'):
-                            total_lines += 1
-                            hits = int(line.attrib.get('hits', '0'))
-                            total_line_hits += hits
-                            if hits > 0:
-                                covered_lines += 1
-                                method_has_coverage = True
-                    if method_has_coverage:
-                        covered_methods += 1
-            
+
+        if tag == 'line':
+            # Lines directly inside the class, or inside one of its methods
+            if stack[5:] == ['lines'] or (in_method and stack[5:] == ['methods', 'method', 'lines']):
+                total_lines += 1
+                hits = int(elem.attrib.get('hits', '0'))
+                total_line_hits += hits
+                if hits > 0:
+                    covered_lines += 1
+                    if in_method:
+                        method_has_coverage = True
+            elem.clear()
+        elif tag == 'method' and in_method and stack[5:] == ['methods']:
+            if method_has_coverage:
+                covered_methods += 1
+            in_method = False
+            elem.clear()
+        elif tag == 'class' and len(stack) == 4:
             # Save results keyed by class name
             coverage_info[class_name] = {
                 'total_lines': total_lines,
@@ -76,9 +84,17 @@ def parse_coverage(file_path):
                 'total_line_hits': total_line_hits,
                 'covered_methods': covered_methods
             }
-    
+            class_name = None
+            elem.clear()
+
     return coverage_info
 
+def cached_parse_coverage(file_path):
+    """
+    parse_coverage, memoized on disk by file path and mtime (see coverage_cache.py).
+    """
+    return cached("class", [file_path], parse_coverage, file_path)
+
 # Example usage:
 def combine_coverage_files(file_paths):
     """
@@ -103,7 +119,7 @@ def combine_coverage_files(file_paths):
     combined_coverage = {}
     
     for path in file_paths:
-        file_coverage = parse_coverage(path)
+        file_coverage = cached_parse_coverage(path)
         for class_name, metrics in file_coverage.items():
             if class_name not in combined_coverage:
                 # Create a copy of the metrics dictionary for the new class entry.
@@ -119,38 +135,25 @@ def combine_coverage_files(file_paths):
     return combined_coverage
 
 
-def find_files_with_substring(directory, substring):
-    """
-    Return a list of file names in the given directory
-    that contain the given substring.
-    """
-    result = []
-    
-    # List all files in the given directory
-    for filename in os.listdir(directory):
-        full_path = os.path.join(directory, filename)
-        
-        # Check if it's a file and contains the substring
-        if os.path.isfile(full_path) and substring in filename:
-            result.append(filename)
-    
-    return result
-
-
 def extract_class_coverage(p,t):
     #print(p,t)
+    if load_coverage_matrix is not None:
+        matrix = load_coverage_matrix(p)
+        if matrix is not None:
+            return class_coverage(matrix, rows_for_class(matrix, t))
+
     base_path = "/home/yinseok/lorafl/"
 
     if p=="Closure":
         project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
     
-    data_path = "/home/yinseok/lorafl/mutation_data"
+    data_path = f"/home/yinseok/lorafl/mutation_data/{p}"
 
     results_path = data_path + "/results"
 
     coverage_path = data_path + "/coverage"
 
-    files = find_files_with_substring(coverage_path, t)
+    files = files_for_class(coverage_path, t)
 
     coverage_files = []
     
@@ -159,7 +162,7 @@ def extract_class_coverage(p,t):
         coverage_files.append(coverage_path+"/"+file)
 
 
-    data = combine_coverage_files(coverage_files)
+    data = cached("class-combined", coverage_files, combine_coverage_files, coverage_files)
     #for cls, info in data.items():
     #    print(f"Class: {cls}")
     #    for key, value in info.items():
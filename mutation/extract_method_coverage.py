@@ -1,6 +1,17 @@
 import xml.etree.ElementTree as ET
+import json
 import os
-def parse_methods_coverage(file_path, target_class_name):
+
+from coverage_cache import cached
+from file_index import files_for_class
+
+# The packed coverage matrix needs NumPy; without it everything is read from XML
+try:
+    from coverage_matrix import load_coverage_matrix, rows_for_class, method_coverage
+except ImportError:
+    load_coverage_matrix = None
+
+def parse_methods_coverage(file_path, target_class_name, stop_early=True):
     """
     Parse a Cobertura-style coverage XML file for a given class and extract method-level coverage metrics.
     
@@ -12,9 +23,15 @@ def parse_methods_coverage(file_path, target_class_name):
       - covered_lines: number of <line> elements with hits > 0.
       - total_line_hits: sum of all the hit counts for that method's lines.
       
+    The file is streamed with iterparse and elements are cleared once counted. With
+    stop_early, parsing stops at the end of the first package that contained a matching
+    class (a class and its inner classes always share a package), so the rest of the
+    report is never read.
+
     Parameters:
       file_path (str): Path to the coverage.xml file.
       target_class_name (str): The fully qualified name of the class to extract method information from.
+      stop_early (bool): Stop after the package holding the target class.
       
     Returns:
       dict: A dictionary where each key is a method name and its value is a dictionary:
@@ -25,102 +42,80 @@ def parse_methods_coverage(file_path, target_class_name):
             }
     """
     print(file_path)
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
     methods_coverage = {}
     method_counter = {}
 
-    packages = root.find('packages')
-    if packages is None:
-        return methods_coverage  # No packages element found.
-    
-    # Iterate over all packages and classes to find the specified target class.
-    """
-    for package in packages.findall('package'):
-        classes = package.find('classes')
-        if classes is None:
-            continue
-        for clazz in classes.findall('class'):
-            if target_class_name in clazz.attrib.get('name'):
-                methods_elem = clazz.find('methods')
-                if methods_elem is None:
-                    continue
-                for method in methods_elem.findall('method'):
-                    method_name = method.attrib.get('name')
-                    total_lines = 0
-                    covered_lines = 0
-                    total_line_hits = 0
-                    
-                    # Process the <lines> block inside the method.
-                    lines_elem = method.find('lines')
-                    if lines_elem is not None:
-                        for line in lines_elem.findall('line'):
-                            total_lines += 1
-                            hits = int(line.attrib.get('hits', '0'))
-                            total_line_hits += hits
-                            if hits > 0:
-                                covered_lines += 1
-                    # If the same method appears multiple times (e.g. in different packages), aggregate its metrics.
-                    if method_name in methods_coverage:
-                        methods_coverage[method_name]['total_lines'] += total_lines
-                        methods_coverage[method_name]['covered_lines'] += covered_lines
-                        methods_coverage[method_name]['total_line_hits'] += total_line_hits
-                    else:
-                        methods_coverage[method_name] = {
-                            'total_lines': total_lines,
-                            'covered_lines': covered_lines,
-                            'total_line_hits': total_line_hits
-                        }
-
-    return methods_coverage"""
-    for package in packages.findall('package'):
-        classes = package.find('classes')
-        if classes is None:
+    # Tags of the currently open elements, root first
+    stack = []
+    matched_class = False
+    in_method = False
+    seen_target = False
+
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            if stack[1:] == ['packages', 'package', 'classes', 'class']:
+                matched_class = target_class_name in elem.attrib.get('name')
+                seen_target = seen_target or matched_class
+            elif matched_class and stack[5:] == ['methods', 'method']:
+                in_method = True
+                method_name = elem.attrib.get('name')
+                total_lines = 0
+                covered_lines = 0
+                total_line_hits = 0
+                start_line = float('inf')
+                end_line = float('-inf')
             continue
-        for clazz in classes.findall('class'):
-            if target_class_name in clazz.attrib.get('name'):
-                methods_elem = clazz.find('methods')
-                if methods_elem is None:
-                    continue
-                for method in methods_elem.findall('method'):
-                    method_name = method.attrib.get('name')
-                    total_lines = 0
-                    covered_lines = 0
-                    total_line_hits = 0
-                    start_line = float('inf')
-                    end_line = float('-inf')
-
-                    # Process the <lines> block inside the method.
-                    lines_elem = method.find('lines')
-                    if lines_elem is not None:
-                        for line in lines_elem.findall('line'):
-                            line_num = int(line.attrib.get('number'))
-                            start_line = min(start_line, line_num)
-                            end_line = max(end_line, line_num)
-
-                            total_lines += 1
-                            hits = int(line.attrib.get('hits', '0'))
-                            total_line_hits += hits
-                            if hits > 0:
-                                covered_lines += 1
-
-                    # Construct unique method identifier
-                    base_key = method_name
-                    method_counter[base_key] = method_counter.get(base_key, 0) + 1
-                    method_key = f"{base_key}#{method_counter[base_key]}"
-
-                    methods_coverage[method_key] = {
-                        'total_lines': total_lines,
-                        'covered_lines': covered_lines,
-                        'total_line_hits': total_line_hits,
-                        'start_line': start_line if start_line != float('inf') else None,
-                        'end_line': end_line if end_line != float('-inf') else None
-                    }
+
+        tag = stack.pop()
+
+        if tag == 'line':
+            # Process the <lines> block inside the method.
+            if in_method and stack[5:] == ['methods', 'method', 'lines']:
+                line_num = int(elem.attrib.get('number'))
+                start_line = min(start_line, line_num)
+                end_line = max(end_line, line_num)
+
+                total_lines += 1
+                hits = int(elem.attrib.get('hits', '0'))
+                total_line_hits += hits
+                if hits > 0:
+                    covered_lines += 1
+            elem.clear()
+        elif tag == 'method' and in_method and stack[5:] == ['methods']:
+            in_method = False
+
+            # Construct unique method identifier
+            base_key = method_name
+            method_counter[base_key] = method_counter.get(base_key, 0) + 1
+            method_key = f"{base_key}#{method_counter[base_key]}"
+
+            methods_coverage[method_key] = {
+                'total_lines': total_lines,
+                'covered_lines': covered_lines,
+                'total_line_hits': total_line_hits,
+                'start_line': start_line if start_line != float('inf') else None,
+                'end_line': end_line if end_line != float('-inf') else None
+            }
+            elem.clear()
+        elif tag == 'class' and len(stack) == 4:
+            matched_class = False
+            elem.clear()
+        elif tag == 'package' and len(stack) == 2:
+            elem.clear()
+            if stop_early and seen_target:
+                break
 
     return methods_coverage
 
 
+def cached_parse_methods_coverage(file_path, target_class_name):
+    """
+    parse_methods_coverage, memoized on disk by file path, mtime and target class (see coverage_cache.py).
+    """
+    return cached("methods", [file_path], parse_methods_coverage, file_path, target_class_name)
+
+
 def combine_methods_coverage(file_paths, target_class_name):
     """
     Combine method-level coverage metrics for a given class from multiple coverage XML files.
@@ -144,7 +139,7 @@ def combine_methods_coverage(file_paths, target_class_name):
     combined_methods = {}
     
     for path in file_paths:
-        file_methods = parse_methods_coverage(path, target_class_name)
+        file_methods = cached_parse_methods_coverage(path, target_class_name)
         for method_name, metrics in file_methods.items():
             if method_name in combined_methods:
                 #combined_methods[method_name]['total_lines'] += metrics.get('total_lines', 0)
@@ -155,22 +150,131 @@ def combine_methods_coverage(file_paths, target_class_name):
     
     return combined_methods
 
-def find_files_with_substring(directory, substring):
+def parse_line_hits(file_path, t):
     """
-    Return a list of file names in the given directory
-    that contain the given substring.
+    Sorted line numbers of class t, or of one of its inner classes (they share the same
+    source file), with hits > 0 in a coverage XML file.
     """
-    result = []
-    # List all files in the given directory
-    for filename in os.listdir(directory):
-        full_path = os.path.join(directory, filename)
-        # Check if it's a file and contains the substring
-        if os.path.isfile(full_path) and substring in filename:
-            result.append(filename)
-    return result
+    lines = set()
+    matched_class = False
+    seen_target = False
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'class':
+                class_name = elem.attrib.get('name', '')
+                matched_class = class_name == t or class_name.startswith(t + "$")
+                seen_target = seen_target or matched_class
+            continue
+        if elem.tag == 'line':
+            if matched_class and int(elem.attrib.get('hits', '0')) > 0:
+                lines.add(int(elem.attrib.get('number')))
+            elem.clear()
+        elif elem.tag == 'class':
+            matched_class = False
+            elem.clear()
+        elif elem.tag == 'package' and seen_target:
+            break
+    return sorted(lines)
+
+
+def parse_static_init_lines(file_path, t):
+    """
+    Sorted line numbers of the static initializers (<clinit>) of class t and its inner
+    classes in a coverage XML file, whether they ran or not.
+    """
+    lines = set()
+    matched_class = False
+    in_clinit = False
+    seen_target = False
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'class':
+                class_name = elem.attrib.get('name', '')
+                matched_class = class_name == t or class_name.startswith(t + "$")
+                seen_target = seen_target or matched_class
+            elif elem.tag == 'method':
+                in_clinit = matched_class and elem.attrib.get('name') == '<clinit>'
+            continue
+        if elem.tag == 'line':
+            if in_clinit:
+                lines.add(int(elem.attrib.get('number')))
+            elem.clear()
+        elif elem.tag == 'method':
+            in_clinit = False
+            elem.clear()
+        elif elem.tag == 'class':
+            matched_class = False
+            elem.clear()
+        elif elem.tag == 'package' and seen_target:
+            break
+    return sorted(lines)
+
+
+def build_line_test_index(p, t):
+    """
+    Build a line -> tests index for class t from the per-test coverage of the whole
+    suite (see apply_coverage.collect_suite_coverage).
+
+    Every suite_coverage/<test>.xml holds the coverage of that test alone, so a line
+    with hits > 0 in class t is reached by it. Tests whose run completed without
+    coverage (<test>.none) might reach any line. Static initializer lines are listed
+    apart: a class is initialized once per JVM, so session coverage credits them to
+    whichever test loaded the class first.
+
+    Returns:
+      dict: {"lines": line number -> sorted "<TestClass>::<testMethod>" names,
+             "unknown": tests without coverage, "static": static initializer lines},
+            or None when the suite coverage is missing or does not cover every test,
+            in which case mutants must run the full suite.
+    """
+    suite_path = f"/home/yinseok/lorafl/mutation_data/{p}/suite_coverage"
+    try:
+        with open(suite_path + "/tests.json", encoding="utf-8") as f:
+            suite = json.load(f)
+    except FileNotFoundError:
+        print(f"No suite coverage for {p}, running the full suite")
+        return None
+    if suite["unresolved"]:
+        print(f"Suite coverage of {p} misses {len(suite['unresolved'])} test classes, running the full suite")
+        return None
+
+    covered = []
+    unknown = []
+    missing = 0
+    for tc in suite["tests"]:
+        if os.path.isfile(f"{suite_path}/{tc}.xml"):
+            covered.append(tc)
+        elif os.path.isfile(f"{suite_path}/{tc}.none"):
+            unknown.append(tc)
+        else:
+            missing += 1
+    if missing or not covered:
+        print(f"Suite coverage of {p} is incomplete ({missing}/{len(suite['tests'])} tests missing), running the full suite")
+        return None
+
+    line_index = {}
+    for tc in covered:
+        file_path = f"{suite_path}/{tc}.xml"
+        for lineno in cached("line-hits", [file_path], parse_line_hits, file_path, t):
+            line_index.setdefault(lineno, set()).add(tc)
+
+    # Every report lists the same methods, so one file gives the static initializer lines
+    file_path = f"{suite_path}/{covered[0]}.xml"
+    static_lines = cached("static-init-lines", [file_path], parse_static_init_lines, file_path, t)
+
+    return {
+        "lines": {lineno: sorted(tests) for lineno, tests in line_index.items()},
+        "unknown": sorted(unknown),
+        "static": static_lines,
+    }
 
 
 def extract_method_coverage(p,t):
+     if load_coverage_matrix is not None:
+         matrix = load_coverage_matrix(p)
+         if matrix is not None:
+             return method_coverage(matrix, rows_for_class(matrix, t), t)
+
      base_path = "/home/yinseok/lorafl/"
 
      #if p=="Closure":
@@ -182,7 +286,7 @@ def extract_method_coverage(p,t):
 
      coverage_path = data_path + "/coverage"
 
-     files = find_files_with_substring(coverage_path, t)
+     files = files_for_class(coverage_path, t)
 
      coverage_files = []
 
@@ -190,7 +294,7 @@ def extract_method_coverage(p,t):
          coverage_files.append(coverage_path+"/"+file)
 
 
-     data = combine_methods_coverage(coverage_files,t)
+     data = cached("methods-combined", coverage_files, combine_methods_coverage, coverage_files, t)
      return data
      #for cls, info in data.items():
      #    print(f"Method: {cls}")
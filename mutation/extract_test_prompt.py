@@ -1,9 +1,12 @@
 import os
-import glob
 import json
 import re
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
 
 from parse_failing_test import parse_failing_tests
+from source_files import test_dir, resolve_class_file, load_json
 
 def extract_relevant_stack_trace(stack_trace, method_name):
     lines = stack_trace.strip().split('\n')
@@ -23,11 +26,16 @@ def extract_relevant_stack_trace(stack_trace, method_name):
     relevant_lines = lines[:last_index + 1]
     return '\n'.join(relevant_lines)
 
-def parse_line(line):
-    #pattern = r'at\s+([\w\.]+)\.([\w]+)\.([\w]+)\(([\w\.]+):(\d+)\)'
-    pattern = r'at\s+([\w\.\$]+)\.([\w\$]+)\.([\w\$]+)\(([\w\.]+):(\d+)\)'
+#FRAME_PATTERN = re.compile(r'at\s+([\w\.]+)\.([\w]+)\.([\w]+)\(([\w\.]+):(\d+)\)')
+FRAME_PATTERN = re.compile(r'at\s+([\w\.\$]+)\.([\w\$]+)\.([\w\$]+)\(([\w\.]+):(\d+)\)')
+
+MAX_CACHED_PROMPTS = 4096
 
-    match = re.match(pattern, line.strip())
+# (p, test class, test method, test JSON path, its mtime, sha1 of error/trace/total) -> rendered report
+_prompts = OrderedDict()
+
+def parse_line(line):
+    match = FRAME_PATTERN.match(line.strip())
     
     if not match:
         return None  # Or raise an error if you'd prefer
@@ -46,21 +54,42 @@ def parse_line(line):
         'lineno': lineno
     }
 
-def extract_test_code(original_test_function, parsed_line):
-    methods = original_test_function["methods"]
+def build_test_method_index(original_test_function):
+    """
+    Map each test method name to its (startLine, endLine, snippet) entries, in file order.
+    """
+    index = {}
+    for method in original_test_function["methods"]:
+        index.setdefault(method["name"], []).append((method["startLine"], method["endLine"], method["snippet"]))
+    return index
+
+@lru_cache(maxsize=256)
+def _test_method_index(path, mtime_ns):
+    return build_test_method_index(load_json(path))
+
+def test_method_index(path):
+    """
+    build_test_method_index for the test JSON at path, built once per file version.
+    """
+    return _test_method_index(path, os.stat(path).st_mtime_ns)
+
+def extract_test_code(original_test_function, parsed_line, index=None):
     #print(parsed_line)   
     target_method = parsed_line["test_method"]
     lineno = parsed_line["lineno"]
 
-    for method in methods:
-        if method["name"]==target_method and method["startLine"]<=lineno and method["endLine"]>=lineno:
-            return method["snippet"]
+    if index is None:
+        index = build_test_method_index(original_test_function)
+
+    for start_line, end_line, snippet in index.get(target_method, []):
+        if start_line<=lineno and end_line>=lineno:
+            return snippet
 
     return -1
 
 
 
-def extract_test_function(original_test_function, class_name, method_name,stack_trace ):
+def extract_test_function(original_test_function, class_name, method_name,stack_trace, index=None):
     lines = stack_trace.strip().split('\n')
     
     test_codes = []
@@ -69,33 +98,50 @@ def extract_test_function(original_test_function, class_name, method_name,stack_
         if class_name in line:
             parsed_line = parse_line(line.strip())
             #print(parsed_line)
-            test_code = extract_test_code(original_test_function, parsed_line)
+            test_code = extract_test_code(original_test_function, parsed_line, index)
             if test_code!=-1:
                 test_codes.append(test_code)
 
     return test_codes[-4:]
 
 def extract_test_prompt(p, bug_report,total):
+    """
+    Render the TEST FAILURE REPORT block for a failing test.
+
+    Rows that share a failing test (same project, test class and method, error,
+    stack trace and `total`) get the cached block; the test JSON path and mtime are
+    part of the key, so an updated output_test file is picked up.
+    """
     [class_name, method_name], error_message, stack_trace = bug_report
+    first_file = resolve_class_file(test_dir(p), class_name)
+
+    if first_file is None:
+        print("No bug_report_###.json file found.")
+        return None
+
+    digest = hashlib.sha1(f"{error_message}\0{stack_trace}\0{total}".encode("utf-8")).hexdigest()
+    key = (p, class_name, method_name, first_file, os.stat(first_file).st_mtime_ns, digest)
+    prompt = _prompts.get(key)
+    if prompt is not None:
+        _prompts.move_to_end(key)
+        return prompt
+
+    prompt = render_test_prompt(first_file, class_name, method_name, error_message, stack_trace, total)
+    _prompts[key] = prompt
+    if len(_prompts) > MAX_CACHED_PROMPTS:
+        _prompts.popitem(last=False)
+    return prompt
+
+def render_test_prompt(first_file, class_name, method_name, error_message, stack_trace, total):
     class_name = class_name.split('.')[-1]
-    path = f"/home/yinseok/lorafl/data_preprocess/data_original/{p}/output_test"
 
     stack_trace = extract_relevant_stack_trace(stack_trace, method_name)
 
-    # Find all matching files
-    matching_files = sorted(glob.glob(os.path.join(path, f"{class_name}_*.json")))
-    
-    if not matching_files:
-        print("No bug_report_###.json file found.")
-        return None
-    
-    first_file = matching_files[0]
     print(f"Opening file: {first_file}")
     
-    with open(first_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_json(first_file)
 
-    test_codes = extract_test_function(data,class_name,method_name,stack_trace)
+    test_codes = extract_test_function(data,class_name,method_name,stack_trace,test_method_index(first_file))
     
     test_codes = list(reversed(test_codes))
 
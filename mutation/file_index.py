@@ -0,0 +1,91 @@
+import json
+import os
+
+
+# directory -> (mtime_ns, {filename: class}, {class: [filenames]})
+_indexes = {}
+
+
+def class_of(filename):
+    """
+    Target class encoded in a data file name, e.g.
+      coverage__com.google.javascript.jscomp.NodeUtil__NodeUtilTest::testX.xml
+      failing_tests__com.google.javascript.jscomp.NodeUtil__17
+    both give "com.google.javascript.jscomp.NodeUtil". Returns None for other names.
+    """
+    parts = filename.split("__", 2)
+    if len(parts) < 3 or parts[0] not in ("coverage", "failing_tests"):
+        return None
+    return parts[1]
+
+
+def index_path(directory):
+    return directory.rstrip("/") + ".index.json"
+
+
+def load_index(directory):
+    """
+    Return {class: sorted list of file names} for a coverage/ or results/ directory.
+
+    The index is kept next to the directory (<directory>.index.json) together with the
+    directory's mtime. Adding or removing files changes that mtime; the directory is then
+    re-listed once with os.scandir and only names not seen before are parsed.
+    """
+    mtime = os.stat(directory).st_mtime_ns
+
+    cached = _indexes.get(directory)
+    if cached is not None and cached[0] == mtime:
+        return cached[2]
+
+    known = cached[1] if cached is not None else None
+    if known is None:
+        try:
+            with open(index_path(directory), encoding="utf-8") as f:
+                stored = json.load(f)
+            known = stored["files"]
+            if stored["mtime_ns"] == mtime:
+                by_class = _group(known)
+                _indexes[directory] = (mtime, known, by_class)
+                return by_class
+        except (FileNotFoundError, ValueError, KeyError):
+            known = {}
+
+    files = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name in known:
+                files[entry.name] = known[entry.name]
+            elif entry.is_file():
+                cls = class_of(entry.name)
+                if cls is not None:
+                    files[entry.name] = cls
+
+    by_class = _group(files)
+    _indexes[directory] = (mtime, files, by_class)
+
+    tmp_path = f"{index_path(directory)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"mtime_ns": mtime, "files": files}, f)
+        os.replace(tmp_path, index_path(directory))
+    except OSError as e:
+        print(f"Could not save index for {directory}: {e}")
+
+    return by_class
+
+
+def _group(files):
+    by_class = {}
+    for filename, cls in files.items():
+        by_class.setdefault(cls, []).append(filename)
+    for names in by_class.values():
+        names.sort()
+    return by_class
+
+
+def files_for_class(directory, class_name):
+    """
+    File names in directory that belong to exactly class_name (no substring matches,
+    so NodeUtil does not pick up NodeUtilTest or NodeUtil2 files).
+    """
+    return list(load_index(directory).get(class_name, []))
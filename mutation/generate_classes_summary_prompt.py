@@ -4,122 +4,10 @@ import re
 import random
 
 
-from extract_class_coverage import parse_coverage, extract_class_coverage
-
-def score_classes(data):
-    """
-    Score each class on how related it is to the bug using both percentage-based and naive (absolute) indicators.
-
-    Indicators used:
-      - Percentage-based:
-          * hit_rate: total_line_hits / total_lines
-          * lines_coverage: covered_lines / total_lines
-          * methods_coverage: covered_methods / method_count
-      - Absolute size indicators:
-          * total_lines: absolute value for class size/complexity
-          * method_count: absolute value for class size/complexity
-      - Naive (absolute) coverage counts:
-          * naive_covered_lines: raw covered_lines
-          * naive_total_line_hits: raw total_line_hits
-          * naive_covered_methods: raw covered_methods
-
-    Classes with covered_lines == 0 are excluded.
-
-    The raw metrics are normalized (min-max) across the remaining classes and then combined
-    with weights to compute a final score for each class.
-
-    Returns:
-      A dictionary mapping class names to their normalized score.
-    """
-    # Exclude classes with zero covered_lines
-    filtered_data = {cls: info for cls, info in data.items() if info["covered_lines"] > 0}
-
-    # Compute raw metrics for each class
-    metrics = {}
-    for cls, info in filtered_data.items():
-        total_lines = info["total_lines"]
-        method_count = info["method_count"]
-
-        # Percentage-based indicators: protect against division by zero
-        hit_rate = info["total_line_hits"] / total_lines if total_lines > 0 else 0
-        lines_coverage = info["covered_lines"] / total_lines if total_lines > 0 else 0
-        methods_coverage = info["covered_methods"] / method_count if method_count > 0 else 0
-
-        # Naive (absolute) indicators: raw values
-        naive_covered_lines = info["covered_lines"]
-        naive_total_line_hits = info["total_line_hits"]
-        naive_covered_methods = info["covered_methods"]
-
-        metrics[cls] = {
-            "hit_rate": hit_rate,
-            "lines_coverage": lines_coverage,
-            "methods_coverage": methods_coverage,
-            "total_lines": total_lines,
-            "method_count": method_count,
-            "naive_covered_lines": naive_covered_lines,
-            "naive_total_line_hits": naive_total_line_hits,
-            "naive_covered_methods": naive_covered_methods
-        }
-
-    # List of all metric keys to consider
-    metric_keys = [
-        "hit_rate",
-        "lines_coverage",
-        "methods_coverage",
-        "total_lines",
-        "method_count",
-        "naive_covered_lines",
-        "naive_total_line_hits",
-        "naive_covered_methods"
-    ]
-
-    # Determine the min and max for each metric (for normalization)
-    metric_min = {key: float('inf') for key in metric_keys}
-    metric_max = {key: float('-inf') for key in metric_keys}
-
-    for m in metrics.values():
-        for key in metric_keys:
-            val = m[key]
-            if val < metric_min[key]:
-                metric_min[key] = val
-            if val > metric_max[key]:
-                metric_max[key] = val
-
-    # Normalization helper: scale value to the range [0, 1]
-    def normalize(val, mn, mx):
-        # If all values are the same, return 1.0 (or 0.0); here we treat it as maximum importance.
-        if mx == mn:
-            return 1.0
-        return (val - mn) / (mx - mn)
-
-    # Define weights for each normalized metric
-    weights = {
-        "hit_rate": 1.0,
-        "lines_coverage": 1.0,
-        "methods_coverage": 1.0,
-        "total_lines": 0,
-        "method_count": 0,
-        "naive_covered_lines": 0.5,
-        "naive_total_line_hits": 0.5,
-        "naive_covered_methods": 0.5
-    }
-    total_weight = sum(weights.values())
-
-    # Compute final weighted score for each class
-    scores = {}
-    for cls, m in metrics.items():
-        weighted_sum = 0.0
-        for key in metric_keys:
-            norm_val = normalize(m[key], metric_min[key], metric_max[key])
-            weighted_sum += weights[key] * norm_val
-        # Normalize the combined weighted score so it falls between 0 and 1.
-        score = weighted_sum / total_weight
-        scores[cls] = score
-
-    return scores
-
-
-
+from extract_class_coverage import cached_parse_coverage, extract_class_coverage
+from class_summary_table import classes_csv_path, load_class_summaries
+from weighted_sampler import weighted_sample
+from class_scoring import score_classes
 
 def select_classes(scores, n, bias=1.0):
     """
@@ -163,29 +51,12 @@ def select_classes(scores, n, bias=1.0):
             print(f"{cls}: score={scores[cls]}, norm={(scores[cls] - min_score)/(max_score - min_score) if max_score > min_score else 1.0}")
         print("Falling back to pure random.")
         return random.sample(list(scores.keys()), min(n, len(scores)))
-    selected = []
-
-    total_weight = sum(weights)
-    if total_weight == 0:
-        # fallback to pure random if weights are degenerate
-        return random.sample(list(scores.keys()), n)
     try:
-        for _ in range(n):
-            if not population:
-                break
-            chosen = random.choices(population=population, weights=weights, k=1)[0]
-            selected.append(chosen)
-            idx = population.index(chosen)
-            del population[idx]
-            del weights[idx]
-    except ValueError as e:
-        if "Total of weights must be greater than zero" in str(e):
-            print("Caught ValueError: Total of weights must be greater than zero. Falling back to random sampling.")
-            return random.sample(list(scores.keys()), n)
-        else:
-            raise e  # re-raise any other ValueError
-
-    return selected
+        return weighted_sample(population, weights, n)
+    except ValueError:
+        # Fewer positive weights than n, e.g. n == len(scores): the lowest score always has weight 0
+        print("Not enough classes with a positive weight. Falling back to random sampling.")
+        return random.sample(list(scores.keys()), n)
 
 
 
@@ -255,7 +126,7 @@ def generate_prompt_1(p,target_class,test_class,test_method, coverage_data2, fil
             file_path = file_path2
         #print("here1")
         else:
-            coverage_data = parse_coverage(coverage_file_path)
+            coverage_data = cached_parse_coverage(coverage_file_path)
             file_path = coverage_file_path
     else:
         fp = f"CLASS:{target_class}"
@@ -304,24 +175,7 @@ def generate_prompt_1(p,target_class,test_class,test_method, coverage_data2, fil
         selected_classes[i] = selected_classes[i] +".java"
         #print(selected_classes[i])
 
-    class_file_path = f"/home/yinseok/lorafl/data/{p}/classes.csv"
-
-    file_names = []
-    summaries = []
-    
-    with open(class_file_path, 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader)
-        for row in reader:
-            file_names.append(row[0].strip())
-            summaries.append(row[1].strip())
-    
-    
-
-
-    if p=="Closure":
-        for i in range(len(file_names)):
-            file_names[i] = "com.google." + file_names[i]
+    class_summaries = load_class_summaries(classes_csv_path(p), "com.google." if p=="Closure" else "")
 
 
     covered_classes_for_prompt = ""####
@@ -329,11 +183,10 @@ def generate_prompt_1(p,target_class,test_class,test_method, coverage_data2, fil
 
     i = 1
     for covered_class in selected_classes:
-        if covered_class in file_names:
-            index = file_names.index(covered_class)
+        if covered_class in class_summaries:
             class_name = covered_class.split(".")[-2]
 
-            summary = summaries[index]
+            summary = class_summaries[covered_class]
 
             #covered_classes_for_prompt += f"  Class {i} : <{class_name}>\n"
             covered_classes_for_prompt += f"  Class {i} : <{class_name}> : {summary}\n"
@@ -367,7 +220,7 @@ def generate_prompt_2(p,target_class,test_class,test_method,count, coverage_data
             coverage_data = coverage_data2
             file_path = file_path2
         else:
-            coverage_data = parse_coverage(coverage_file_path)
+            coverage_data = cached_parse_coverage(coverage_file_path)
             file_path = coverage_file_path
     else:
         fp = f"CLASS:{target_class}"
@@ -4,126 +4,14 @@ import re
 import random
 import json
 
-from extract_method_coverage import extract_method_coverage, parse_methods_coverage
+from extract_method_coverage import extract_method_coverage, cached_parse_methods_coverage
+from source_index import get_source_index
+from weighted_sampler import weighted_sample
+from class_scoring import score_classes
 #from extract_class_coverage import parse_coverage, extract_class_coverage
 
 MAX_TOKEN = 3000
 
-def score_classes(data):
-    """
-    Score each class on how related it is to the bug using both percentage-based and naive (absolute) indicators.
-
-    Indicators used:
-      - Percentage-based:
-          * hit_rate: total_line_hits / total_lines
-          * lines_coverage: covered_lines / total_lines
-          * methods_coverage: covered_methods / method_count
-      - Absolute size indicators:
-          * total_lines: absolute value for class size/complexity
-          * method_count: absolute value for class size/complexity
-      - Naive (absolute) coverage counts:
-          * naive_covered_lines: raw covered_lines
-          * naive_total_line_hits: raw total_line_hits
-          * naive_covered_methods: raw covered_methods
-
-    Classes with covered_lines == 0 are excluded.
-
-    The raw metrics are normalized (min-max) across the remaining classes and then combined
-    with weights to compute a final score for each class.
-
-    Returns:
-      A dictionary mapping class names to their normalized score.
-    """
-    # Exclude classes with zero covered_lines
-    filtered_data = {cls: info for cls, info in data.items() if info["covered_lines"] > 0}
-
-    # Compute raw metrics for each class
-    metrics = {}
-    for cls, info in filtered_data.items():
-        total_lines = info["total_lines"]
-        method_count = info["method_count"]
-
-        # Percentage-based indicators: protect against division by zero
-        hit_rate = info["total_line_hits"] / total_lines if total_lines > 0 else 0
-        lines_coverage = info["covered_lines"] / total_lines if total_lines > 0 else 0
-        methods_coverage = info["covered_methods"] / method_count if method_count > 0 else 0
-
-        # Naive (absolute) indicators: raw values
-        naive_covered_lines = info["covered_lines"]
-        naive_total_line_hits = info["total_line_hits"]
-        naive_covered_methods = info["covered_methods"]
-
-        metrics[cls] = {
-            "hit_rate": hit_rate,
-            "lines_coverage": lines_coverage,
-            "methods_coverage": methods_coverage,
-            "total_lines": total_lines,
-            "method_count": method_count,
-            "naive_covered_lines": naive_covered_lines,
-            "naive_total_line_hits": naive_total_line_hits,
-            "naive_covered_methods": naive_covered_methods
-        }
-
-    # List of all metric keys to consider
-    metric_keys = [
-        "hit_rate",
-        "lines_coverage",
-        "methods_coverage",
-        "total_lines",
-        "method_count",
-        "naive_covered_lines",
-        "naive_total_line_hits",
-        "naive_covered_methods"
-    ]
-
-    # Determine the min and max for each metric (for normalization)
-    metric_min = {key: float('inf') for key in metric_keys}
-    metric_max = {key: float('-inf') for key in metric_keys}
-
-    for m in metrics.values():
-        for key in metric_keys:
-            val = m[key]
-            if val < metric_min[key]:
-                metric_min[key] = val
-            if val > metric_max[key]:
-                metric_max[key] = val
-
-    # Normalization helper: scale value to the range [0, 1]
-    def normalize(val, mn, mx):
-        # If all values are the same, return 1.0 (or 0.0); here we treat it as maximum importance.
-        if mx == mn:
-            return 1.0
-        return (val - mn) / (mx - mn)
-
-    # Define weights for each normalized metric
-    weights = {
-        "hit_rate": 1.0,
-        "lines_coverage": 1.0,
-        "methods_coverage": 1.0,
-        "total_lines": 0,
-        "method_count": 0,
-        "naive_covered_lines": 0.5,
-        "naive_total_line_hits": 0.5,
-        "naive_covered_methods": 0.5
-    }
-    total_weight = sum(weights.values())
-
-    # Compute final weighted score for each class
-    scores = {}
-    for cls, m in metrics.items():
-        weighted_sum = 0.0
-        for key in metric_keys:
-            norm_val = normalize(m[key], metric_min[key], metric_max[key])
-            weighted_sum += weights[key] * norm_val
-        # Normalize the combined weighted score so it falls between 0 and 1.
-        score = weighted_sum / total_weight
-        scores[cls] = score
-
-    return scores
-
-
-
-
 def select_classes(scores, n, bias=1.0):
     """
     Select n classes from scores dict.
@@ -166,29 +54,12 @@ def select_classes(scores, n, bias=1.0):
             print(f"{cls}: score={scores[cls]}, norm={(scores[cls] - min_score)/(max_score - min_score) if max_score > min_score else 1.0}")
         print("Falling back to pure random.")
         return random.sample(list(scores.keys()), min(n, len(scores)))
-    selected = []
-
-    total_weight = sum(weights)
-    if total_weight == 0:
-        # fallback to pure random if weights are degenerate
-        return random.sample(list(scores.keys()), n)
     try:
-        for _ in range(n):
-            if not population:
-                break
-            chosen = random.choices(population=population, weights=weights, k=1)[0]
-            selected.append(chosen)
-            idx = population.index(chosen)
-            del population[idx]
-            del weights[idx]
-    except ValueError as e:
-        if "Total of weights must be greater than zero" in str(e):
-            print("Caught ValueError: Total of weights must be greater than zero. Falling back to random sampling.")
-            return random.sample(list(scores.keys()), n)
-        else:
-            raise e  # re-raise any other ValueError
-
-    return selected
+        return weighted_sample(population, weights, n)
+    except ValueError:
+        # Fewer positive weights than n, e.g. n == len(scores): the lowest score always has weight 0
+        print("Not enough classes with a positive weight. Falling back to random sampling.")
+        return random.sample(list(scores.keys()), n)
 
 
 
@@ -247,11 +118,14 @@ def print_data(data):
 
 import random
 
-def exclude_method(coverage_data, parsed_log, exclude):
+def exclude_candidates(coverage_data, parsed_log):
+    """
+    Keys of coverage_data that may be dropped from the prompt: every method except
+    the mutated one.
+    """
     target_method_name = (parsed_log["location"].split("@")[-1]).split("(")[0]
 
-    # Step 1: Build list of candidate methods to exclude
-    candidates = [
+    return [
         key for key, val in coverage_data.items()
         if not (
             target_method_name in key and
@@ -260,8 +134,20 @@ def exclude_method(coverage_data, parsed_log, exclude):
         )
     ]
 
+def exclude_method(coverage_data, parsed_log, exclude):
+    """
+    Drop methods from coverage_data. `exclude` is either a number of methods to
+    drop at random, or an explicit list of keys to drop (see token_budget.pick_drops).
+    """
+    # Step 1: Build list of candidate methods to exclude
+    candidates = exclude_candidates(coverage_data, parsed_log)
+
     # Step 2: Randomly select 'exclude' keys to remove
-    keys_to_remove = random.sample(candidates, min(exclude, len(candidates)))
+    if isinstance(exclude, int):
+        keys_to_remove = random.sample(candidates, min(exclude, len(candidates)))
+    else:
+        allowed = set(candidates)
+        keys_to_remove = [key for key in exclude if key in allowed]
     # Step 3: Delete them from the original dict
     for key in keys_to_remove:
         del coverage_data[key]
@@ -269,50 +155,43 @@ def exclude_method(coverage_data, parsed_log, exclude):
 
     return coverage_data
 
-def exclude_non_existing(coverage_data, source_data):
-    def collect_all_signatures(src):
-        method_entries = []
-
-        # Constructors
-        for cons in src.get("constructors", []):
-            method_entries.append({
-                "name": "<init>",
-                "start": cons["startLine"],
-                "end": cons["endLine"]
-            })
-
-        # Methods
-        for method in src.get("methods", []):
-            method_entries.append({
-                "name": method["name"],
-                "start": method["startLine"],
-                "end": method["endLine"]
-            })
+def method_snippets(coverage_data, source_data):
+    """
+    Text each covered method contributes to the apply_mutation prompt: its header,
+    comment, body and its line under ##EXISTING_METHODS. A key matches source
+    members the same way apply_mutation does (same name, end line within 10).
 
-        # Inner types (recursively)
-        for inner in src.get("innerTypes", []):
-            method_entries.extend(collect_all_signatures(inner))
+    Returns:
+        dict: coverage key -> text
+    """
+    index = get_source_index(source_data)
 
-        return method_entries
+    snippets = {}
+    for key, info in coverage_data.items():
+        if info.get('covered_lines', 0) <= 0:
+            continue
+        name = key.split('#')[0]
+        end_line = info.get('end_line', info.get('endLine'))
+        parts = []
+        for _, _, start_line, member in index.matches(name, end_line):
+            display = member["signature"].split("(")[0] if name == '<init>' else name
+            parts.append(f"###Method : {display},    line number : {start_line}")
+            parts.append(member.get('comment', '').strip())
+            parts.append(member['snippet'])
+            parts.append(f"{display}@{start_line}")
+        snippets[key] = "\n".join(parts)
+    return snippets
 
-    # Step 1: Flatten all methods/constructors from source_data
-    valid_methods = collect_all_signatures(source_data)
+def exclude_non_existing(coverage_data, source_data):
+    index = get_source_index(source_data)
 
-    # Step 2: Build new filtered dict
+    # Keep the methods that still exist in source_data (same name, end line within 10)
     filtered = {}
     for key, cov_info in coverage_data.items():
         # Remove #suffix from method name
         method_name = key.split("#")[0]
 
-        cov_end = cov_info["end_line"]
-
-        # Try to find a matching method or constructor
-        exists = any(
-            m["name"] == method_name and abs(m["end"] - cov_end) <= 10
-            for m in valid_methods
-        )
-
-        if exists:
+        if index.matches(method_name, cov_info["end_line"]):
             filtered[key] = cov_info
 
     return filtered
@@ -364,24 +243,13 @@ def apply_mutation(coverage_data, source_data, lineno, original_code, mutated_co
         # Convert unicode escapes (e.g. "\u003d") to real characters
         return bytes(s, 'utf-8').decode('unicode_escape') if s else ''
 
+    index = get_source_index(source_data)
+    covered_orders = index.covered_orders(covered)
+    sorted_orders = sorted(covered_orders)
+
     def class_has_covered(cls):
-        # Check constructors
-        for e in covered.get('<init>', []):
-            for ctor in cls.get('constructors', []):
-                if abs(ctor['endLine'] - e) <= 10:
-                    return True
-        # Check methods
-        for name, ends in covered.items():
-            if name == '<init>':
-                continue
-            for m in cls.get('methods', []):
-                if m['name'] == name and any(abs(m['endLine'] - e) <= 10 for e in ends):
-                    return True
-        # Recurse into inner types
-        for inner in cls.get('innerTypes', []):
-            if class_has_covered(inner):
-                return True
-        return False
+        # Any covered constructor or method in cls or its inner types
+        return index.subtree_has(cls, sorted_orders)
 
     def process_class(cls, indent_level=0):
         indent = '    ' * indent_level
@@ -397,35 +265,32 @@ def apply_mutation(coverage_data, source_data, lineno, original_code, mutated_co
 
         # Constructors
         for ctor in cls.get('constructors', []):
-            for e in covered.get('<init>', []):
-                if abs(ctor['endLine'] - e) <= 10:
-                    snippet = decode_unicode(ctor['snippet']).splitlines()
-                    
-                    name = ctor["signature"].split("(")[0]
-                    startline = ctor["startLine"]
-
-                    lines.append( f"{indent}    ###Method : {name},    line number : {startline}")
-                    
-                    method_review.append([name,startline])
-
-                    # Constructor comment
-                    cmt = ctor.get('comment', '').strip()
-                    if cmt:
-                        lines.append(f"{indent}    {cmt}")
-                    # Body
-                    for ln in snippet:
-                        lines.append(f"{indent}    {ln}")
-                    lines.append('')
-                    break
+            if index.order[id(ctor)] not in covered_orders:
+                continue
+            snippet = decode_unicode(ctor['snippet']).splitlines()
+            
+            name = ctor["signature"].split("(")[0]
+            startline = ctor["startLine"]
+
+            lines.append( f"{indent}    ###Method : {name},    line number : {startline}")
+            
+            method_review.append([name,startline])
+
+            # Constructor comment
+            cmt = ctor.get('comment', '').strip()
+            if cmt:
+                lines.append(f"{indent}    {cmt}")
+            # Body
+            for ln in snippet:
+                lines.append(f"{indent}    {ln}")
+            lines.append('')
 
         # Methods
         for m in cls.get('methods', []):
             name = m['name']
             startline = m['startLine']
 
-            if name not in covered:
-                continue
-            if not any(abs(m['endLine'] - e) <= 10 for e in covered[name]):
+            if index.order[id(m)] not in covered_orders:
                 continue
             lines.append('')
             lines.append(f"{indent}    ###Method : {name},      line number : {startline}")
@@ -484,22 +349,7 @@ def return_answer(coverage_data, source_data, lineno, target_method, choices_cou
     The first entry is always the mutated `target_method`, followed by random covered entries.
     Constructors use the class name.
     """
-    # Helper: find method/ctor entry by name and line margin
-    def find_entry(cls, name, start, end):
-        # constructors
-        if name == '<init>':
-            for ctor in cls.get('constructors', []):
-                if abs(ctor['startLine'] - start) <= 10 and abs(ctor['endLine'] - end) <= 10:
-                    return ctor['startLine'],ctor["signature"]
-        else:
-            for m in cls.get('methods', []):
-                if m['name'] == name and abs(m['startLine']-start)<=10 and abs(m['endLine']-end)<=10:
-                    return m['startLine'],None
-        for inner in cls.get('innerTypes', []):
-            rv = find_entry(inner, name, start, end)
-            if rv is not None:
-                return rv
-        return None
+    index = get_source_index(source_data)
 
     # Build all covered candidates
     candidates = []  # list of (display_name, startLine)
@@ -510,10 +360,11 @@ def return_answer(coverage_data, source_data, lineno, target_method, choices_cou
         #print(name)
         start = info.get('start_line', info.get('startLine'))
         end = info.get('end_line', info.get('endLine'))
-        rv = find_entry(source_data, name, start, end)
-        if rv is None:
+        node = index.find(name, start, end)
+        if node is None:
             continue
-        sl,signature = rv
+        sl = node['startLine']
+        signature = node['signature'] if name == '<init>' else None
         display = signature.split("(")[0] if name == '<init>' else name
         #print(display,sl)
         candidates.append((display, sl))
@@ -564,7 +415,7 @@ def generate_prompt_2_1(p,target_class,test_class,test_method,parsed_log,source_
             coverage_data = coverage_data2
             file_path = file_path2
         else:
-            coverage_data = parse_methods_coverage(coverage_file_path,target_class)
+            coverage_data = cached_parse_methods_coverage(coverage_file_path,target_class)
             file_path = coverage_file_path
     else:
         fp = f"CLASS:{target_class}"
@@ -0,0 +1,163 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.FileReader;
+import java.io.IOException;
+import java.io.OutputStreamWriter;
+import java.io.Writer;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+import org.jacoco.core.analysis.Analyzer;
+import org.jacoco.core.analysis.CoverageBuilder;
+import org.jacoco.core.analysis.IClassCoverage;
+import org.jacoco.core.analysis.ICounter;
+import org.jacoco.core.analysis.ILine;
+import org.jacoco.core.analysis.IMethodCoverage;
+import org.jacoco.core.analysis.ISourceNode;
+import org.jacoco.core.tools.ExecFileLoader;
+
+/**
+ * Turns the per-test session files written by PerTestCoverage into coverage XML with the
+ * layout of defects4j's Cobertura reports:
+ * packages/package/classes/class/methods/method/lines/line, plus the class-level lines
+ * block that repeats every line of the class.
+ *
+ * JaCoCo only records whether a line ran, so hits is 1 for a line with a covered
+ * instruction and 0 otherwise.
+ *
+ * Usage: CoberturaReport &lt;classes dir&gt; &lt;class list&gt; &lt;exec dir&gt; &lt;out dir&gt; &lt;prefix&gt;
+ * writes &lt;out dir&gt;/&lt;prefix&gt;&lt;name&gt;.xml for every &lt;exec dir&gt;/&lt;name&gt;.exec. Only the
+ * classes named in the class list (one fully qualified name per line, as given to
+ * defects4j coverage -i) and their inner classes are reported.
+ */
+public class CoberturaReport {
+
+    public static void main(String[] args) throws IOException {
+        File classesDir = new File(args[0]);
+        Set<String> included = readClassList(new File(args[1]));
+        File[] execs = new File(args[2]).listFiles();
+        Arrays.sort(execs);
+
+        for (File exec : execs) {
+            String name = exec.getName();
+            if (!name.endsWith(".exec")) {
+                continue;
+            }
+            ExecFileLoader loader = new ExecFileLoader();
+            loader.load(exec);
+            CoverageBuilder builder = new CoverageBuilder();
+            new Analyzer(loader.getExecutionDataStore(), builder).analyzeAll(classesDir);
+
+            String test = name.substring(0, name.length() - ".exec".length());
+            write(builder, included, new File(args[3], args[4] + test + ".xml"));
+        }
+    }
+
+    private static Set<String> readClassList(File file) throws IOException {
+        Set<String> included = new HashSet<String>();
+        BufferedReader reader = new BufferedReader(new FileReader(file));
+        try {
+            for (String line = reader.readLine(); line != null; line = reader.readLine()) {
+                if (!line.trim().isEmpty()) {
+                    included.add(line.trim());
+                }
+            }
+        } finally {
+            reader.close();
+        }
+        return included;
+    }
+
+    private static void write(CoverageBuilder builder, Set<String> included, File file) throws IOException {
+        List<IClassCoverage> classes = new ArrayList<IClassCoverage>();
+        for (IClassCoverage cc : builder.getClasses()) {
+            String className = cc.getName().replace('/', '.');
+            int inner = className.indexOf('$');
+            if (included.contains(inner < 0 ? className : className.substring(0, inner))) {
+                classes.add(cc);
+            }
+        }
+        Collections.sort(classes, new Comparator<IClassCoverage>() {
+            public int compare(IClassCoverage a, IClassCoverage b) {
+                int c = a.getPackageName().compareTo(b.getPackageName());
+                return c != 0 ? c : a.getName().compareTo(b.getName());
+            }
+        });
+
+        File tmp = new File(file.getPath() + ".tmp");
+        Writer out = new OutputStreamWriter(new FileOutputStream(tmp), "UTF-8");
+        try {
+            out.write("<?xml version=\"1.0\"?>\n<coverage>\n<packages>\n");
+            String openPackage = null;
+            for (IClassCoverage cc : classes) {
+                String packageName = cc.getPackageName().replace('/', '.');
+                if (!packageName.equals(openPackage)) {
+                    if (openPackage != null) {
+                        out.write("</classes>\n</package>\n");
+                    }
+                    out.write("<package name=\"" + escape(packageName) + "\">\n<classes>\n");
+                    openPackage = packageName;
+                }
+                writeClass(out, cc);
+            }
+            if (openPackage != null) {
+                out.write("</classes>\n</package>\n");
+            }
+            out.write("</packages>\n</coverage>\n");
+        } finally {
+            out.close();
+        }
+        if (!tmp.renameTo(file)) {
+            throw new IOException("Cannot write " + file);
+        }
+    }
+
+    private static void writeClass(Writer out, IClassCoverage cc) throws IOException {
+        String sourceFile = cc.getSourceFileName() != null
+                ? cc.getSourceFileName() : cc.getName().replaceAll("^.*/|\\$.*$", "") + ".java";
+        String fileName = cc.getPackageName().isEmpty() ? sourceFile : cc.getPackageName() + "/" + sourceFile;
+        out.write("<class name=\"" + escape(cc.getName().replace('/', '.'))
+                + "\" filename=\"" + escape(fileName) + "\">\n<methods>\n");
+
+        List<IMethodCoverage> methods = new ArrayList<IMethodCoverage>(cc.getMethods());
+        Collections.sort(methods, new Comparator<IMethodCoverage>() {
+            public int compare(IMethodCoverage a, IMethodCoverage b) {
+                int c = a.getName().compareTo(b.getName());
+                return c != 0 ? c : a.getDesc().compareTo(b.getDesc());
+            }
+        });
+        for (IMethodCoverage mc : methods) {
+            out.write("<method name=\"" + escape(mc.getName()) + "\" signature=\"" + escape(mc.getDesc()) + "\">\n");
+            writeLines(out, mc);
+            out.write("</method>\n");
+        }
+        out.write("</methods>\n");
+        writeLines(out, cc);
+        out.write("</class>\n");
+    }
+
+    private static void writeLines(Writer out, ISourceNode node) throws IOException {
+        out.write("<lines>\n");
+        if (node.getFirstLine() != ISourceNode.UNKNOWN_LINE) {
+            for (int nr = node.getFirstLine(); nr <= node.getLastLine(); nr++) {
+                ILine line = node.getLine(nr);
+                if (line.getStatus() == ICounter.EMPTY) {
+                    continue;
+                }
+                int hits = line.getInstructionCounter().getCoveredCount() > 0 ? 1 : 0;
+                out.write("<line number=\"" + nr + "\" hits=\"" + hits + "\"/>\n");
+            }
+        }
+        out.write("</lines>\n");
+    }
+
+    private static String escape(String s) {
+        return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\"", "&quot;");
+    }
+}
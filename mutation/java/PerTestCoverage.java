@@ -0,0 +1,69 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.FileReader;
+import java.io.IOException;
+import java.io.OutputStream;
+import java.util.ArrayList;
+import java.util.List;
+
+import org.jacoco.agent.rt.IAgent;
+import org.jacoco.agent.rt.RT;
+import org.junit.runner.JUnitCore;
+import org.junit.runner.Request;
+import org.junit.runner.Result;
+
+/**
+ * Runs tests one after another in this JVM, which must carry the JaCoCo agent
+ * (-javaagent:jacocoagent.jar=output=none), and writes the execution data of each test
+ * to its own session file, &lt;outdir&gt;/&lt;TestClass::testMethod&gt;.exec.
+ *
+ * Usage: PerTestCoverage &lt;outdir&gt; &lt;test list&gt;, where the test list file holds one
+ * TestClass::testMethod per line.
+ */
+public class PerTestCoverage {
+
+    public static void main(String[] args) throws IOException {
+        File outDir = new File(args[0]);
+        outDir.mkdirs();
+        IAgent agent = RT.getAgent();
+        JUnitCore core = new JUnitCore();
+
+        for (String test : readTests(new File(args[1]))) {
+            int sep = test.indexOf("::");
+            // Only this test's probes end up in its session
+            agent.reset();
+            try {
+                Class<?> testClass = Class.forName(test.substring(0, sep));
+                Result result = core.run(Request.method(testClass, test.substring(sep + 2)));
+                System.out.println(test + ": " + (result.wasSuccessful() ? "pass" : "fail"));
+            } catch (Throwable e) {
+                System.out.println(test + ": " + e);
+                continue;
+            }
+            OutputStream out = new FileOutputStream(new File(outDir, test + ".exec"));
+            try {
+                out.write(agent.getExecutionData(false));
+            } finally {
+                out.close();
+            }
+        }
+        // Test code may leave non-daemon threads behind
+        System.exit(0);
+    }
+
+    private static List<String> readTests(File file) throws IOException {
+        List<String> tests = new ArrayList<String>();
+        BufferedReader reader = new BufferedReader(new FileReader(file));
+        try {
+            for (String line = reader.readLine(); line != null; line = reader.readLine()) {
+                if (line.contains("::")) {
+                    tests.add(line.trim());
+                }
+            }
+        } finally {
+            reader.close();
+        }
+        return tests;
+    }
+}
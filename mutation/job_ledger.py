@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+
+
+LEDGER_PATH = "/home/yinseok/lorafl/mutation_data/ledger.sqlite"
+
+# One connection may be shared by the worker threads of build_data_from_mutation_parallel
+_lock = threading.Lock()
+_session = {"start": time.time(), "done": 0}
+
+
+def open_ledger(path=LEDGER_PATH):
+    """
+    Open (and create if needed) the job ledger.
+
+    Every unit of work is one row keyed by (project, class, mutant, stage).
+    Class-level stages use mutant "*".
+    """
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+               project  TEXT NOT NULL,
+               class    TEXT NOT NULL,
+               mutant   TEXT NOT NULL,
+               stage    TEXT NOT NULL,
+               status   TEXT NOT NULL,
+               attempts INTEGER NOT NULL DEFAULT 0,
+               error    TEXT,
+               elapsed  REAL,
+               updated  REAL,
+               PRIMARY KEY (project, class, mutant, stage)
+           )"""
+    )
+    conn.commit()
+    return conn
+
+
+def job_status(conn, key):
+    """
+    Return the status ("done" / "failed") of key = (project, class, mutant, stage), or None.
+    """
+    with _lock:
+        row = conn.execute(
+            "SELECT status FROM jobs WHERE project=? AND class=? AND mutant=? AND stage=?",
+            tuple(str(k) for k in key),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def is_done(conn, key):
+    return job_status(conn, key) == "done"
+
+
+def record_job(conn, key, status, error=None, elapsed=None):
+    """
+    Insert or update the ledger row for key, counting one more attempt.
+    """
+    with _lock:
+        conn.execute(
+            """INSERT INTO jobs (project, class, mutant, stage, status, attempts, error, elapsed, updated)
+               VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)
+               ON CONFLICT (project, class, mutant, stage) DO UPDATE SET
+                   status=excluded.status, attempts=attempts + 1, error=excluded.error,
+                   elapsed=excluded.elapsed, updated=excluded.updated""",
+            tuple(str(k) for k in key) + (status, error, elapsed, time.time()),
+        )
+        conn.commit()
+        if status == "done":
+            _session["done"] += 1
+
+
+def run_job(conn, key, fn, *args, retries=3, backoff=30, **kwargs):
+    """
+    Run fn(*args, **kwargs) as the job `key` unless the ledger already has it as done.
+
+    Failures are recorded with their error message and retried up to `retries` times,
+    waiting backoff, 2*backoff, 4*backoff, ... seconds in between.
+
+    Returns:
+      (status, result): status is "skipped", "done" or "failed".
+    """
+    if is_done(conn, key):
+        return "skipped", None
+
+    for attempt in range(retries):
+        start = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"{key} failed (attempt {attempt + 1}/{retries}): {e}")
+            record_job(conn, key, "failed", error=repr(e), elapsed=time.time() - start)
+            if attempt + 1 < retries:
+                time.sleep(backoff * 2 ** attempt)
+            continue
+        record_job(conn, key, "done", elapsed=time.time() - start)
+        return "done", result
+
+    return "failed", None
+
+
+def report_progress(conn, project):
+    """
+    Print done/failed counts per stage for a project and the throughput of this session.
+    """
+    with _lock:
+        rows = conn.execute(
+            "SELECT stage, status, COUNT(*) FROM jobs WHERE project=? GROUP BY stage, status ORDER BY stage",
+            (project,),
+        ).fetchall()
+
+    counts = {}
+    for stage, status, count in rows:
+        counts.setdefault(stage, {})[status] = count
+    for stage, c in counts.items():
+        print(f"[{project}] {stage}: done={c.get('done', 0)} failed={c.get('failed', 0)}")
+
+    elapsed = time.time() - _session["start"]
+    rate = _session["done"] / elapsed * 3600 if elapsed > 0 else 0.0
+    print(f"[{project}] this session: {_session['done']} jobs done in {elapsed:.0f}s ({rate:.1f} jobs/h)")
+    return counts
@@ -0,0 +1,88 @@
+import json
+import os
+
+
+class JsonlWriter:
+    """
+    Incremental JSONL writer for long dataset builds.
+
+    Records go to <path>.part and are flushed (and fsynced) every `batch_size` records.
+    After each flush <path>.resume records the last fully written input row and the byte
+    offset of the .part file at that point. close() renames <path>.part onto <path>
+    atomically and removes the marker, so <path> only ever holds a complete dataset.
+
+    If a previous run died, opening the same path with resume=True truncates the .part
+    file back to the last recorded offset and exposes that row as `last_row`, so the
+    caller can skip everything up to and including it. `params` (any JSON value, e.g.
+    the input csv and build options) is stored in the marker as well; a leftover .part
+    written with different params is discarded and the build starts over.
+
+    Use as a context manager: on an exception the .part file and the marker of the last
+    completed flush are kept for the next run.
+    """
+
+    def __init__(self, path, batch_size=100, resume=True, params=None):
+        self.path = path
+        self.part_path = path + ".part"
+        self.marker_path = path + ".resume"
+        self.batch_size = batch_size
+        # Round-trip through JSON so tuples and lists compare equal to what the marker holds
+        self.params = json.loads(json.dumps(params))
+        self.last_row = 0
+        self.pending = 0
+
+        marker = None
+        if resume and os.path.exists(self.part_path) and os.path.exists(self.marker_path):
+            with open(self.marker_path, encoding="utf-8") as f:
+                marker = json.load(f)
+            if marker.get("params") != self.params:
+                print(f"{self.part_path} was built with {marker.get('params')}, not {self.params}; starting over")
+                marker = None
+
+        if marker is not None:
+            self.last_row = marker["row"]
+            self.file = open(self.part_path, "r+", encoding="utf-8")
+            self.file.truncate(marker["offset"])
+            self.file.seek(marker["offset"])
+            print(f"Resuming {path} after row {self.last_row}")
+        else:
+            self.file = open(self.part_path, "w", encoding="utf-8")
+        self.row = self.last_row
+
+    def write_row(self, row, records):
+        """
+        Write all records produced for input row `row`; rows must arrive in increasing order.
+        """
+        for item in records:
+            json.dump(item, self.file, ensure_ascii=False)
+            self.file.write('\n')
+        self.pending += len(records)
+        self.row = row
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        tmp_path = self.marker_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"row": self.row, "offset": self.file.tell(), "params": self.params}, f)
+        os.replace(tmp_path, self.marker_path)
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        os.replace(self.part_path, self.path)
+        os.remove(self.marker_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave the marker at the last completed flush; a row may be half written
+            self.file.close()
+        return False
@@ -0,0 +1,138 @@
+import json
+import os
+from functools import lru_cache
+
+
+# directory -> (mtime_ns, {filename: [simple name, fully qualified name]}, {simple name: [filenames]})
+_manifests = {}
+
+
+def source_dir(p):
+    return f"/home/yinseok/lorafl/data_preprocess/data_original/{p}/output_source"
+
+
+def test_dir(p):
+    return f"/home/yinseok/lorafl/data_preprocess/data_original/{p}/output_test"
+
+
+def manifest_path(directory):
+    return directory.rstrip("/") + ".manifest.json"
+
+
+def _describe(directory, filename):
+    """
+    [simple name, fully qualified name] for <Class>_<n>.json, or None for other files.
+    """
+    if not filename.endswith(".json") or "_" not in filename:
+        return None
+    simple_name = filename[:-len(".json")].rsplit("_", 1)[0]
+    try:
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            data = json.load(f)
+        package = data.get("packageName") or ""
+        fqn = f"{package}.{data.get('name', simple_name)}" if package else data.get("name", simple_name)
+    except (OSError, ValueError, AttributeError):
+        fqn = None
+    return [simple_name, fqn]
+
+
+def load_manifest(directory):
+    """
+    Return (files, by_name) for an output_source/ or output_test/ directory:
+      files:   {filename: [simple class name, fully qualified name]}
+      by_name: {simple class name: sorted filenames}
+
+    Like file_index.load_index, the manifest is stored next to the directory
+    (<directory>.manifest.json) with the directory mtime, and only files not seen
+    before are opened when the directory changes.
+    """
+    mtime = os.stat(directory).st_mtime_ns
+
+    cached = _manifests.get(directory)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    known = cached[1] if cached is not None else None
+    if known is None:
+        try:
+            with open(manifest_path(directory), encoding="utf-8") as f:
+                stored = json.load(f)
+            known = stored["files"]
+            if stored["mtime_ns"] == mtime:
+                by_name = _group(known)
+                _manifests[directory] = (mtime, known, by_name)
+                return known, by_name
+        except (FileNotFoundError, ValueError, KeyError):
+            known = {}
+
+    files = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name in known:
+                files[entry.name] = known[entry.name]
+            elif entry.is_file():
+                described = _describe(directory, entry.name)
+                if described is not None:
+                    files[entry.name] = described
+
+    by_name = _group(files)
+    _manifests[directory] = (mtime, files, by_name)
+
+    tmp_path = f"{manifest_path(directory)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"mtime_ns": mtime, "files": files}, f)
+        os.replace(tmp_path, manifest_path(directory))
+    except OSError as e:
+        print(f"Could not save manifest for {directory}: {e}")
+
+    return files, by_name
+
+
+def _group(files):
+    by_name = {}
+    for filename, (simple_name, _) in files.items():
+        by_name.setdefault(simple_name, []).append(filename)
+    for names in by_name.values():
+        names.sort()
+    return by_name
+
+
+def resolve_class_file(directory, class_name, numbered=False):
+    """
+    Path of the JSON for class_name in directory, or None.
+
+    class_name may be simple ("NodeUtil") or fully qualified
+    ("com.google.javascript.jscomp.NodeUtil"); a fully qualified name picks the file
+    whose packageName matches when several classes share the simple name, and
+    otherwise falls back to the first file. With numbered, only <Class>_<digits>.json
+    files are considered.
+    """
+    files, by_name = load_manifest(directory)
+    simple_name = class_name.split(".")[-1]
+
+    candidates = by_name.get(simple_name, [])
+    if numbered:
+        candidates = [f for f in candidates if f[len(simple_name) + 1:-len(".json")].isdigit()]
+    if not candidates:
+        return None
+
+    if "." in class_name:
+        for filename in candidates:
+            if files[filename][1] == class_name:
+                return os.path.join(directory, filename)
+    return os.path.join(directory, candidates[0])
+
+
+@lru_cache(maxsize=256)
+def _load_json(path, mtime_ns):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_json(path):
+    """
+    Parsed JSON at path, cached (LRU) until the file changes. The same object is
+    returned to every caller, so it must be treated as read-only.
+    """
+    return _load_json(path, os.stat(path).st_mtime_ns)
@@ -0,0 +1,105 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+
+MAX_CACHED_INDEXES = 64
+
+# id(source_data) -> (source_data, SourceIndex); the JSON is kept alive so its id stays valid
+_indexes = OrderedDict()
+
+
+class SourceIndex:
+    """
+    Lookup tables over one output_source JSON (class with 'constructors', 'methods'
+    and recursive 'innerTypes').
+
+    Members are numbered in the order the old recursive walks visited them: for each
+    class its constructors, then its methods, then its inner types depth first. So the
+    member with the lowest number among several matches is the one a first-match
+    walk would have returned. Constructors are indexed under the name '<init>'.
+
+      by_name:  name -> (sorted end lines, [(endLine, order, startLine, node), ...])
+      order:    id(member node) -> order
+      span:     id(class node) -> (first order, end order) of the members in its subtree
+    """
+
+    def __init__(self, source_data):
+        self.by_name = {}
+        self.order = {}
+        self.span = {}
+        self._walk(source_data)
+        for name, entries in self.by_name.items():
+            entries.sort(key=lambda e: (e[0], e[1]))
+            self.by_name[name] = ([e[0] for e in entries], entries)
+
+    def _add(self, name, node):
+        order = len(self.order)
+        self.order[id(node)] = order
+        self.by_name.setdefault(name, []).append((node['endLine'], order, node['startLine'], node))
+
+    def _walk(self, cls):
+        first = len(self.order)
+        for ctor in cls.get('constructors', []):
+            self._add('<init>', ctor)
+        for m in cls.get('methods', []):
+            self._add(m['name'], m)
+        for inner in cls.get('innerTypes', []):
+            self._walk(inner)
+        self.span[id(cls)] = (first, len(self.order))
+
+    def matches(self, name, end, margin=10):
+        """
+        Entries named `name` whose end line is within `margin` of `end`, in walk order.
+        """
+        if name not in self.by_name:
+            return []
+        ends, entries = self.by_name[name]
+        lo = bisect_left(ends, end - margin)
+        hi = bisect_right(ends, end + margin)
+        return sorted(entries[lo:hi], key=lambda e: e[1])
+
+    def find(self, name, start, end, margin=10):
+        """
+        First member (in walk order) named `name` with both start and end line within
+        `margin` of the given lines, or None.
+        """
+        for _, _, member_start, node in self.matches(name, end, margin):
+            if abs(member_start - start) <= margin:
+                return node
+        return None
+
+    def covered_orders(self, covered, margin=10):
+        """
+        Set of member orders matched by covered = {name: [end lines]}.
+        """
+        orders = set()
+        for name, ends in covered.items():
+            for e in ends:
+                orders.update(entry[1] for entry in self.matches(name, e, margin))
+        return orders
+
+    def subtree_has(self, cls, sorted_orders):
+        """
+        Whether any of sorted_orders belongs to a member of cls or its inner types.
+        """
+        first, end = self.span[id(cls)]
+        i = bisect_left(sorted_orders, first)
+        return i < len(sorted_orders) and sorted_orders[i] < end
+
+
+def get_source_index(source_data):
+    """
+    SourceIndex for source_data, built on first use and shared by every prompt made
+    from the same loaded JSON.
+    """
+    key = id(source_data)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] is source_data:
+        _indexes.move_to_end(key)
+        return cached[1]
+
+    index = SourceIndex(source_data)
+    _indexes[key] = (source_data, index)
+    if len(_indexes) > MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
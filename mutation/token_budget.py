@@ -0,0 +1,102 @@
+import hashlib
+import math
+import os
+import re
+from collections import OrderedDict
+
+
+# Tokenizer used to size training prompts; should match the model being fine-tuned
+TOKENIZER_DIR = os.environ.get("LORAFL_TOKENIZER", "meta-llama/Meta-Llama-3-8B-Instruct")
+MAX_CACHED_COUNTS = 200000
+
+_tokenizer = None
+_counts = OrderedDict()
+
+
+def approx_token_count(text: str,
+                       avg_chars_per_token: float = 4.0) -> int:
+    """
+    Approximate the number of LLaMA‑3 tokens in `text` by:
+      1) taking its character length divided by avg_chars_per_token, AND
+      2) making sure we never undercount very short strings.
+
+    Args:
+      text: your prompt + completion string
+      avg_chars_per_token: empirical average chars per token (~3.7–4.2).
+                           4.0 is a safe default.
+    Returns:
+      An integer estimate of token count.
+    """
+    # 1) Base on raw character count
+    char_based = len(text) / avg_chars_per_token
+
+    # 2) Also consider splitting on whitespace to catch very short strings
+    word_count = len(re.findall(r"\S+", text))  # every non‑space chunk
+    word_based = word_count * 0.75               # ~0.75 tokens per word
+
+    # Use the larger estimate (safer upper bound), round up
+    return math.ceil(max(char_based, word_based, 1.0))
+
+
+def get_tokenizer():
+    """
+    Load the tokenizer from TOKENIZER_DIR once per process. Returns None (and
+    count_tokens falls back to approx_token_count) if transformers or the
+    tokenizer files are not available.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_DIR, use_fast=True)
+        except Exception as e:
+            print(f"Tokenizer {TOKENIZER_DIR} unavailable, using approx_token_count: {e}")
+            _tokenizer = False
+    return _tokenizer or None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens in `text` with the real tokenizer (no special tokens),
+    memoized by the SHA-1 of the text so repeated snippets and prompts are
+    tokenized once.
+    """
+    key = hashlib.sha1(text.encode("utf-8")).digest()
+    count = _counts.get(key)
+    if count is not None:
+        _counts.move_to_end(key)
+        return count
+
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        count = approx_token_count(text)
+    else:
+        count = len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    _counts[key] = count
+    if len(_counts) > MAX_CACHED_COUNTS:
+        _counts.popitem(last=False)
+    return count
+
+
+def pick_drops(candidates, costs, overflow):
+    """
+    Choose methods to drop so that at least `overflow` tokens are removed.
+
+    Parameters:
+        candidates (list): droppable method keys, already in the order they should be
+                           considered (callers shuffle them to keep the drop random).
+        costs (dict): method key -> tokens its snippet adds to the prompt.
+        overflow (int): tokens over the budget.
+    Returns:
+        list: the shortest prefix of candidates whose costs add up to overflow, or all
+              candidates if they cannot cover it.
+    """
+    drops = []
+    saved = 0
+    for key in candidates:
+        if saved >= overflow:
+            break
+        drops.append(key)
+        saved += costs.get(key, 0)
+    return drops
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+
+def weighted_sample(population, weights, k, rng=random):
+    """
+    Draw k distinct items from population, each draw picking among the remaining items
+    with probability proportional to its weight.
+
+    Uses Efraimidis–Spirakis keys: every item gets key log(u) / w with u uniform in
+    (0, 1), and the k largest keys, in descending order, have the same distribution as
+    k sequential draws without replacement. This is one vectorized pass instead of k
+    draws that each rebuild the cumulative weights.
+
+    Parameters:
+        population (list): items to choose from.
+        weights (list of float): non-negative weight per item.
+        k (int): number of items to draw.
+        rng: random.Random-like source; the NumPy generator is seeded from it, so seeding
+             the `random` module (the default) makes the result reproducible.
+    Returns:
+        list: k items, in draw order.
+    Raises:
+        ValueError: if fewer than k items have a positive weight (random.choices would
+                    run out of weight before the k-th draw).
+    """
+    w = np.asarray(weights, dtype=float)
+    positive = np.flatnonzero(w > 0)
+    if len(positive) < k:
+        raise ValueError(f"Only {len(positive)} positive weights for {k} draws")
+    if k <= 0:
+        return []
+
+    generator = np.random.default_rng(rng.getrandbits(64))
+    u = generator.random(len(positive))
+    # 1 - u lies in (0, 1], so the log is finite
+    keys = np.log1p(-u) / w[positive]
+
+    top = np.argpartition(-keys, k - 1)[:k]
+    top = top[np.argsort(-keys[top], kind="stable")]
+    return [population[i] for i in positive[top]]
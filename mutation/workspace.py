@@ -0,0 +1,229 @@
+import os
+import shutil
+import time
+
+from run_command import run_command
+
+
+def project_paths(p):
+    """
+    Return (project_path, original_path) for a project.
+
+    project_path is the working checkout that mutants and tests run in,
+    original_path is the pristine checkout it is restored from.
+    """
+    if p=="Chart":
+        project_path = "/home/yinseok/lorafl/temp/Chart_1/Chart_1_fixed"
+        original_path = "/home/yinseok/ttr_1/temp/Chart_1/Chart_1_fixed"
+    elif p=="Lang":
+        project_path = "/home/yinseok/lorafl/temp/Lang_1/Lang_1_fixed"
+        original_path = "/home/yinseok/ttr_1/temp/Lang_1/Lang_1_fixed"
+    elif p=="Time":
+        project_path = "/home/yinseok/lorafl/temp/Time_4/Time_4_fixed"
+        original_path = "/home/yinseok/ttr_1/temp/Time_4/Time_4_fixed"
+    elif p=="Closure":
+        project_path = "/home/yinseok/lorafl/temp/Closure_1/Closure_1_fixed"
+        original_path = "/home/yinseok/ttr_1/temp/Closure_1/Closure_1_fixed"
+    else:
+        raise ValueError(f"Unknown project: {p}")
+    return project_path, original_path
+
+
+def reset_workspace(project_path, original_path):
+    """
+    Replace everything under project_path with a fresh copy of original_path.
+    """
+    for item in os.listdir(project_path):
+        item_path = os.path.join(project_path, item)
+        if os.path.isfile(item_path) or os.path.islink(item_path):
+            os.unlink(item_path)
+        elif os.path.isdir(item_path):
+            shutil.rmtree(item_path)
+
+    # Copy everything from original_path to project_path
+    for item in os.listdir(original_path):
+        s = os.path.join(original_path, item)
+        d = os.path.join(project_path, item)
+        if os.path.isdir(s):
+            shutil.copytree(s, d)
+        else:
+            shutil.copy2(s, d)
+
+
+_pristine_manifests = {}
+
+
+def scan_tree(root):
+    """
+    Walk root with os.scandir and return (files, dirs):
+      files: relative path -> (size, mtime_ns) for every file and symlink
+      dirs:  set of relative directory paths
+    Only metadata is read, no file contents.
+    """
+    files = {}
+    dirs = set()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.add(rel)
+                    stack.append(rel)
+                else:
+                    st = entry.stat(follow_symlinks=False)
+                    files[rel] = (st.st_size, st.st_mtime_ns)
+    return files, dirs
+
+
+def pristine_manifest(original_path):
+    """
+    Manifest (see scan_tree) of the pristine checkout, computed once per process.
+    """
+    if original_path not in _pristine_manifests:
+        _pristine_manifests[original_path] = scan_tree(original_path)
+    return _pristine_manifests[original_path]
+
+
+def restore_workspace(project_path, original_path, touched=()):
+    """
+    Bring project_path back to the state of original_path by restoring only what changed.
+
+    Instead of deleting and re-copying the whole tree, the working copy is compared
+    against a cached manifest of the pristine checkout (size + mtime, both kept by
+    shutil.copy2) and:
+      - files that differ or are missing are copied back from original_path,
+      - files and directories that do not exist in original_path (build outputs,
+        failing_tests, coverage.xml, ...) are removed.
+    Paths in `touched` (e.g. the mutated .java file) are always restored.
+
+    Returns:
+      int: number of files/directories that had to be restored or removed.
+    """
+    if not os.path.isdir(project_path) or not os.listdir(project_path):
+        os.makedirs(project_path, exist_ok=True)
+        reset_workspace(project_path, original_path)
+        return -1
+
+    pristine_files, pristine_dirs = pristine_manifest(original_path)
+    current_files, current_dirs = scan_tree(project_path)
+
+    changed = 0
+
+    # Remove directories the pristine tree does not have (outermost first)
+    for rel in sorted(current_dirs - pristine_dirs, key=len):
+        path = os.path.join(project_path, rel)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            changed += 1
+
+    # Remove files the pristine tree does not have
+    for rel in current_files.keys() - pristine_files.keys():
+        path = os.path.join(project_path, rel)
+        if os.path.lexists(path):
+            os.unlink(path)
+            changed += 1
+
+    for rel in sorted(pristine_dirs - current_dirs, key=len):
+        os.makedirs(os.path.join(project_path, rel), exist_ok=True)
+
+    touched = {os.path.relpath(t, project_path) for t in touched}
+    for rel, meta in pristine_files.items():
+        if rel in touched or current_files.get(rel) != meta:
+            s = os.path.join(original_path, rel)
+            d = os.path.join(project_path, rel)
+            if os.path.isdir(d) and not os.path.islink(d):
+                shutil.rmtree(d)
+            elif os.path.lexists(d):
+                os.unlink(d)
+            shutil.copy2(s, d, follow_symlinks=False)
+            changed += 1
+
+    return changed
+
+
+def worker_path(p, k):
+    """
+    Path of the k-th isolated working copy of project p, next to the main checkout.
+    e.g. .../Closure_1/Closure_1_fixed_w3
+    """
+    project_path, _ = project_paths(p)
+    return f"{project_path}_w{k}"
+
+
+def provision_workspaces(p, k, source_path=None):
+    """
+    Make sure k independent working copies of project p exist and return their paths.
+
+    New copies are taken from source_path (the pristine checkout by default).
+    Copies that already exist are reused as-is; callers reset them before use.
+    """
+    if source_path is None:
+        _, source_path = project_paths(p)
+    paths = []
+    for w in range(k):
+        path = worker_path(p, w)
+        if not os.path.isdir(path):
+            print(f"Provisioning workspace {path}")
+            shutil.copytree(source_path, path, symlinks=True)
+        paths.append(path)
+    return paths
+
+
+def baseline_path(p):
+    """
+    Path of the compiled baseline of project p, e.g. .../Closure_1/Closure_1_fixed_baseline
+    """
+    project_path, _ = project_paths(p)
+    return f"{project_path}_baseline"
+
+
+def provision_baseline(p):
+    """
+    Create (once) a copy of the pristine checkout with sources and tests already compiled.
+
+    Working copies restored from this baseline keep up-to-date class files, so the
+    javac task in the Defects4J build only recompiles sources newer than their
+    classes -- for a single-line mutant, just the mutated compilation unit.
+    The pristine checkout itself is left untouched.
+    """
+    path = baseline_path(p)
+    marker = os.path.join(path, ".baseline_compiled")
+    if os.path.isfile(marker):
+        return path
+
+    _, original_path = project_paths(p)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    print(f"Compiling baseline {path}")
+    shutil.copytree(original_path, path, symlinks=True)
+    print(run_command(f"defects4j compile -w {path}"))
+    with open(marker, "w") as f:
+        f.write("compiled")
+    return path
+
+
+def mark_stale(project_path, target_file_path, parsed):
+    """
+    Make sure the next build recompiles what a mutant affects.
+
+    Mutants inside a method body (location "Class@method") only change that
+    compilation unit, whose mtime is bumped past its class file. Mutants outside
+    methods or in static initializers may change constants that javac inlines into
+    other classes, so every .java file in the working copy is marked stale instead
+    (equivalent to a full compile).
+    """
+    now = time.time()
+    location = parsed.get("location", "")
+    if "@" in location and "<clinit>" not in location:
+        os.utime(target_file_path, (now, now))
+        return 1
+
+    count = 0
+    for dirpath, _, filenames in os.walk(project_path):
+        for filename in filenames:
+            if filename.endswith(".java"):
+                os.utime(os.path.join(dirpath, filename), (now, now))
+                count += 1
+    return count